@@ -4,4 +4,4 @@ pushd ../osm/
 ./build.sh
 popd
 $SUMO_HOME/bin/netconvert -s ../osm/osm_edited.net.xml.gz,prt.net.xml -o joined.net.xml
-./net2poly.py -n prt.net.xml -o prt_poly.add.xml --color "#F6473E"
+./net2poly.py -n prt.net.xml -o prt_poly.add.xml --color "#F6473E" --stream
@@ -17,7 +17,9 @@
 # @date    2022-03-06
 
 """
-This script converts the edge geometries of a sumo network to an additional file with polygons
+This script converts the edge geometries of a sumo network to an additional file with polygons.
+With --stream, the net file is parsed incrementally and the coordinates are projected in batches,
+so the memory stays flat for large networks.
 """
 from __future__ import absolute_import
 from __future__ import print_function
@@ -41,6 +43,10 @@ def parse_args():
     argParser.add_argument("--layer", default="10", help="Layer for normal edges")
     argParser.add_argument("--color", default="red", help="Color for normal edges")
     argParser.add_argument("--internal-color", dest="iColor", default="orange", help="Color for internal edges")
+    argParser.add_argument("--stream", action="store_true", default=False,
+                           help="Parse the net incrementally and project the coordinates in batches (needs pyproj)")
+    argParser.add_argument("--batch-size", dest="batchSize", type=int, default=10000,
+                           help="Number of geometries projected at once in stream mode")
 
     options = argParser.parse_args()
     if not options.netFile:
@@ -59,8 +65,113 @@ def getGeometries(options, net):
             yield edge.getID(), edge.getShape(), sum([l.getWidth() for l in edge.getLanes()])
 
 
+def parseShape(shape):
+    return [tuple(float(c) for c in point.split(",")[:2]) for point in shape.split()]
+
+
+def iterparse(netFile):
+    """yields the location element and each top level element of the net once it is complete,
+    dropping the parsed elements so that the tree does not grow"""
+    try:
+        from lxml import etree
+    except ImportError:
+        import xml.etree.ElementTree as etree
+    depth = 0
+    root = None
+    for event, elem in etree.iterparse(sumolib.openz(netFile, 'rb'), events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if root is None:
+                root = elem
+            continue
+        depth -= 1
+        if depth == 1:
+            yield elem
+            root.clear()
+
+
+def streamGeometries(options, location):
+    """yields the geometries of the edges or lanes like getGeometries, location is filled with the
+    attributes of the location element which precedes all edges"""
+    for elem in iterparse(options.netFile):
+        if elem.tag == "location":
+            location.update(elem.attrib)
+        elif elem.tag == "edge":
+            if elem.get("function") == "internal" and not options.internal:
+                continue
+            lanes = [(lane.get("id"), parseShape(lane.get("shape")), float(lane.get("width", 3.2)))
+                     for lane in elem.iter("lane")]
+            if options.lanes:
+                for lane in lanes:
+                    yield lane
+                continue
+            # like sumolib: the middle lane or the average of all lanes
+            if len(lanes) % 2 == 1:
+                shape = lanes[len(lanes) // 2][1]
+            else:
+                minLen = min(len(lane[1]) for lane in lanes)
+                shape = [(sum(lane[1][i][0] for lane in lanes) / len(lanes),
+                          sum(lane[1][i][1] for lane in lanes) / len(lanes)) for i in range(minLen)]
+            yield elem.get("id"), shape, sum([lane[2] for lane in lanes])
+
+
+def writePolys(outf, options, batch, lonLat, geo):
+    start = 0
+    for id, geometry, width in batch:
+        end = start + len(geometry)
+        color = options.iColor if id[0] == ":" else options.color
+        shape = ["%s,%s" % (x, y) for x, y in zip(lonLat[0][start:end].tolist(), lonLat[1][start:end].tolist())]
+        outf.write('    <poly id="%s" color="%s" layer="%s" lineWidth="%s" shape="%s"%s/>\n' %
+                   (id, color, options.layer, width, " ".join(shape), ' geo="1"' if geo else ""))
+        start = end
+
+
+def getTransformer(location):
+    """returns the transformation from net to lon/lat coordinates and the net offset,
+    the transformation is None if the net has no projection"""
+    offset = [float(c) for c in location.get("netOffset", "0,0").split(",")]
+    projParameter = location.get("projParameter", "!")
+    if projParameter == "!":
+        return None, offset
+    import pyproj
+    return pyproj.Transformer.from_proj(pyproj.Proj(projParameter), "EPSG:4326", always_xy=True), offset
+
+
+def project(batch, transformer, offset):
+    import numpy as np
+    xy = np.array([point for id, geometry, width in batch for point in geometry], dtype=float).reshape(-1, 2)
+    if transformer is None:
+        # no projection, the polygons keep the net coordinates
+        return xy[:, 0], xy[:, 1]
+    return transformer.transform(xy[:, 0] - offset[0], xy[:, 1] - offset[1])
+
+
+def stream(options):
+    location = {}
+    with open(options.outFile, 'w') as outf:
+        sumolib.xml.writeHeader(outf, root="additional")
+        batch = []
+        geometries = streamGeometries(options, location)
+        for geometry in geometries:
+            # the location precedes the edges, so it is known once the first geometry arrives
+            transformer, offset = getTransformer(location)
+            batch.append(geometry)
+            break
+        for geometry in geometries:
+            batch.append(geometry)
+            if len(batch) >= options.batchSize:
+                writePolys(outf, options, batch, project(batch, transformer, offset), transformer is not None)
+                batch = []
+        if batch:
+            writePolys(outf, options, batch, project(batch, transformer, offset), transformer is not None)
+        outf.write('</additional>\n')
+
+
 if __name__ == "__main__":
     options = parse_args()
+    if options.stream:
+        stream(options)
+        sys.exit()
     net = sumolib.net.readNet(options.netFile, withInternal=options.internal)
     geomType = 'lane' if options.lanes else 'edge'
 
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# benchmarks of the PRT controllers on a fake traci backend, runs without sumo. Run from the src directory:
+#   python -m benchmarks.bench_controllers --save baseline.json
+#   python -m benchmarks.bench_controllers --baseline baseline.json --threshold 0.2
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from prt import merging_control, operating_strategies, subscriptions, network, fleet, utils
+from benchmarks.fake_traci import FakeWorld
+
+
+def get_options(args=None):
+    argParser = argparse.ArgumentParser(description="benchmarks the PRT controllers on a fake traci backend")
+    argParser.add_argument("--sizes", default="40,400,4000", help="comma separated numbers of vehicles")
+    argParser.add_argument("--zones", default="4,25,100", help="comma separated numbers of ODM zones")
+    argParser.add_argument("--slots", default="100,1000,10000,100000",
+                           help="comma separated numbers of slots reserved at one merge")
+    argParser.add_argument("--steps", type=int, default=200, help="measured steps per benchmark")
+    argParser.add_argument("--components", default=",".join(BENCHMARKS), help="comma separated components to benchmark")
+    argParser.add_argument("--seed", type=int, default=42, help="random seed of the fake simulation")
+    argParser.add_argument("--save", help="write the results to this json, e.g. to use them as baseline")
+    argParser.add_argument("--baseline", help="json of earlier results to compare against")
+    argParser.add_argument("--threshold", type=float, default=0.2,
+                           help="relative increase of the mean latency versus the baseline that counts as regression")
+    return argParser.parse_args(args)
+
+
+def measure(function, repetitions, setup=None):
+    """
+    measures the wall time of a function
+    :param function: the function, called without arguments : function
+    :param repetitions: number of calls : int
+    :param setup: called before each call, not measured : function
+    :return: wall time of each call in seconds : numpy array
+    """
+    durations = np.empty(repetitions)
+    for i in range(repetitions):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations[i] = time.perf_counter() - start
+    return durations
+
+
+def bench_compressors(nr_vehicles, options, corridor=False):
+    """
+    one batched execution step of all compressors of the network per simulation step
+    """
+    world = FakeWorld(nr_vehicles, seed=options.seed)
+    manager = subscriptions.SubscriptionManager(world, subscriptions.ROUTE_VARS if corridor else
+                                                subscriptions.VEHICLE_VARS)
+    net_cache = network.NetworkCache(world)
+    compressors = [merging_control.Compressor(tl_id, -15., 200., 10., 1., 1., 5., manager, net_cache, world)
+                   for tl_id in world.trafficlight.getIDList()]
+    scheduler = merging_control.CorridorScheduler(compressors) if corridor else None
+    state = {'step': 0}
+
+    def setup():
+        world.simulationStep()
+        manager.update()
+        state['step'] += 1
+
+    def execution_step():
+        if scheduler is not None:
+            scheduler.execution_step(state['step'], 1.)
+        else:
+            merging_control.execution_step(compressors, state['step'], 1.)
+    for _ in range(20):  # warm up, fills the v2i zones
+        setup()
+        execution_step()
+    return measure(execution_step, options.steps, setup)
+
+
+def bench_corridor(nr_vehicles, options):
+    """
+    like bench_compressors, with the vehicles scheduled along their routes by the corridor scheduler
+    """
+    return bench_compressors(nr_vehicles, options, corridor=True)
+
+
+def bench_slot_timeline(nr_slots, options):
+    """
+    reserving the earliest slot of a vehicle at a merge with many reserved slots and releasing it again. The inserts
+    and deletes shift the list of slots, which only shows at far more slots than one merge holds within its horizon
+    """
+    rng = np.random.default_rng(options.seed)
+    headway = 1.
+    # reservations 1 to 3 headways apart, about half of the gaps are wide enough for a vehicle
+    timeline = merging_control.SlotTimeline(np.cumsum(rng.uniform(headway, 3. * headway, nr_slots)).tolist())
+    desired = rng.uniform(0., timeline.slots[-1], options.steps).tolist()
+    state = {'call': 0}
+
+    def reserve_and_release():
+        slot = timeline.earliest_slot(desired[state['call']], headway)
+        timeline.reserve(slot)
+        timeline.release(slot)
+        state['call'] += 1
+    return measure(reserve_and_release, options.steps)
+
+
+def write_odm(path, nr_zones, rng):
+    """
+    writes a random ODM in the format of cfg/odm.csv
+    :param path: path to the csv : String
+    :param nr_zones: number of zones : int
+    :param rng: random number generator : numpy Generator
+    :return:
+    """
+    zones = ["pa%s" % i for i in range(nr_zones)]
+    # about 2000 trips per hour independent of the number of zones
+    volumes = rng.poisson(2000. / nr_zones ** 2, (nr_zones, nr_zones))
+    np.fill_diagonal(volumes, 0)
+    scaling_factors = [1.] * 24
+    with open(path, 'w') as f:
+        f.write(";".join(["origin  destination"] + zones + ["", ""] + [str(h) for h in range(1, 25)]) + "\n")
+        for i, zone in enumerate(zones):
+            hours = [str(s) for s in scaling_factors] if i == 0 else [""] * 24
+            f.write(";".join([zone] + [str(v) for v in volumes[i]] + ["", ""] + hours) + "\n")
+    return
+
+
+def bench_trips_from_ODM(nr_zones, options):
+    """
+    generation of the trips of a day from an ODM
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        write_odm(os.path.join(tmp, "odm.csv"), nr_zones, np.random.default_rng(options.seed))
+        utils.trips_from_ODM("odm.csv", tmp, seed=options.seed)  # warm up, utils imports pandas on first use
+        return measure(lambda: utils.trips_from_ODM("odm.csv", tmp, seed=options.seed), max(3, options.steps // 20))
+
+
+def bench_spawn_persons(nr_zones, options):
+    """
+    spawning the persons of a day from an ODM, one call per simulated second
+    """
+    world = FakeWorld(40, seed=options.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_odm(os.path.join(tmp, "odm.csv"), nr_zones, np.random.default_rng(options.seed))
+        trips = utils.TripSchedule.from_dataframe(utils.trips_from_ODM("odm.csv", tmp, seed=options.seed))
+    state = {'step': 0}
+
+    def spawn():
+        utils.spawn_persons(state['step'], trips, world)
+        state['step'] += 1
+    return measure(spawn, 24 * 3600)
+
+
+def fleet_benchmark(nr_vehicles, options, function, world=None):
+    """
+    measures a fleet strategy on a fake simulation, with the fleet state updated before each call (not measured)
+    """
+    if world is None:
+        world = FakeWorld(nr_vehicles, seed=options.seed)
+    distances = world.distance_table()
+    taxi_fleet = fleet.FleetTracker(world, network.NetworkCache(world))
+
+    def setup():
+        world.simulationStep()
+        world.new_reservations(max(1, nr_vehicles // 100))
+        taxi_fleet.update()
+    return measure(lambda: function(distances, taxi_fleet), options.steps, setup)
+
+
+def bench_rebalance(nr_vehicles, options):
+    """
+    assignment of the new idle vehicles to the free station spaces
+    """
+    return fleet_benchmark(nr_vehicles, options, lambda distances, taxi_fleet:
+                           operating_strategies.rebalance('park_optimal_idling', distances=distances, fleet=taxi_fleet))
+
+
+def bench_anticipatory(nr_vehicles, options):
+    """
+    anticipatory rebalancing of the idle and surplus parked vehicles to the stations short of the forecast demand
+    """
+    world = FakeWorld(nr_vehicles, seed=options.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_odm(os.path.join(tmp, "odm.csv"), world.nr_nodes, np.random.default_rng(options.seed))
+        forecast = utils.DemandForecast.from_ODM("odm.csv", tmp)
+    return fleet_benchmark(nr_vehicles, options, lambda distances, taxi_fleet:
+                           operating_strategies.rebalance('anticipatory', distances=distances, fleet=taxi_fleet,
+                                                          forecast=forecast), world)
+
+
+def bench_dispatch(nr_vehicles, options):
+    """
+    optimal dispatch of the free taxis to the open reservations, without time budget
+    """
+    return fleet_benchmark(nr_vehicles, options, lambda distances, taxi_fleet:
+                           operating_strategies.dispatch('optimal', distances, float("inf"), taxi_fleet))
+
+
+BENCHMARKS = {'compressors': (bench_compressors, 'sizes', 'veh'),
+              'corridor': (bench_corridor, 'sizes', 'veh'),
+              'slot_timeline': (bench_slot_timeline, 'slots', 'slots'),
+              'trips_from_ODM': (bench_trips_from_ODM, 'zones', 'zones'),
+              'spawn_persons': (bench_spawn_persons, 'zones', 'zones'),
+              'rebalance': (bench_rebalance, 'sizes', 'veh'),
+              'anticipatory': (bench_anticipatory, 'sizes', 'veh'),
+              'dispatch': (bench_dispatch, 'sizes', 'veh')}
+
+
+def run(options):
+    """
+    runs the benchmarks
+    :param options: options as returned by get_options
+    :return: mean and p95 latency in ms and throughput in calls per second of each benchmark : dictionary
+    """
+    results = {}
+    for component in options.components.split(","):
+        function, scale, unit = BENCHMARKS[component]
+        for size in getattr(options, scale).split(","):
+            durations = function(int(size), options)
+            name = "%s/%s%s" % (component, size, unit)
+            results[name] = {'mean_ms': durations.mean() * 1000., 'p95_ms': np.percentile(durations, 95) * 1000.,
+                             'throughput': len(durations) / durations.sum() if durations.sum() > 0 else float("inf")}
+            print("%-32s mean %9.3f ms  p95 %9.3f ms  %12.1f calls/s" % (name, results[name]['mean_ms'],
+                                                                         results[name]['p95_ms'],
+                                                                         results[name]['throughput']))
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """
+    compares the results with a baseline
+    :param results: results as returned by run : dictionary
+    :param baseline: earlier results : dictionary
+    :param threshold: relative increase of the mean latency that counts as regression : float
+    :return: descriptions of the regressions : list
+    """
+    found = []
+    for name, result in results.items():
+        if name in baseline and result['mean_ms'] > baseline[name]['mean_ms'] * (1. + threshold):
+            found.append("%s: %.3f ms instead of %.3f ms (+%.0f%%)" %
+                         (name, result['mean_ms'], baseline[name]['mean_ms'],
+                          100. * (result['mean_ms'] / baseline[name]['mean_ms'] - 1.)))
+    return found
+
+
+def main(options):
+    results = run(options)
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if options.baseline:
+        with open(options.baseline) as f:
+            found = regressions(results, json.load(f), options.threshold)
+        for regression in found:
+            print("REGRESSION " + regression)
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(get_options()))
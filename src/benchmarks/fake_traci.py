@@ -0,0 +1,415 @@
+import collections
+import numpy as np
+import traci.constants as tc
+from traci.exceptions import TraCIException
+from prt import network as prt_network
+
+Reservation = collections.namedtuple('Reservation', ['id', 'fromEdge', 'toEdge', 'departPos', 'reservationTime',
+                                                     'state'])
+Stage = collections.namedtuple('Stage', ['type'])
+StopData = collections.namedtuple('StopData', ['stoppingPlaceID'])
+
+ST_LENGTH = 300.  # length of the guideway edges between two merges
+RAMP_LENGTH = 150.  # length of the station ramps
+SPEED = 10.
+
+
+class FakeWorld:
+    """
+    a class that stands in for a sumo simulation and its traci connection, so the controllers can be benchmarked
+    without sumo. The network is a ring of nodes, each node is a merge (compressor "sz<i>") of the guideway edge
+    "st<i>" and the station ramp "ramp<i>" (with the parking area "pa<i>") into both of the next edges. The vehicles
+    drive around at constant speed unless a compressor sets their speed, and randomly switch their taxi state. Each
+    reservation is made by a person of the same ID, which rides the dispatched taxi and is delivered at random. If the
+    fake sumo dispatches itself, like sumo it refuses to share its reservations and picks the persons up at random.
+    Attributes:
+        nr_nodes: number of nodes, i.e. compressors and stations : int
+        vids: IDs of the vehicles : list
+        veh_edge: index of the edge of each vehicle (0..nr_nodes-1: st, nr_nodes..: ramp) : numpy array
+        pos: position of each vehicle on its edge : numpy array
+        speed: speed of each vehicle : numpy array
+        odometer: distance driven by each vehicle : numpy array
+        turns: whether each vehicle turns into the ramp at its next nodes, cyclically : numpy array
+        hops: number of nodes each vehicle has passed : numpy array
+        taxi_state: taxi state of each vehicle as in getTaxiFleet : numpy array
+        parked: whether each vehicle is parked : numpy array
+        reservations: open reservations : dictionary
+        persons: vehicle of each person, "" while waiting : dictionary
+        dispatch_algorithm: dispatch algorithm of the fake sumo, "traci" or one of sumo's own : String
+        calls: number of calls per domain.method : Counter
+    Methods:
+        distance_table
+        simulationStep
+        new_reservations
+        route
+        parking_edge
+        close
+    """
+    def __init__(self, nr_vehicles, nr_nodes=None, seed=42, dispatch_algorithm="traci"):
+        """
+        initializer of the class, places the vehicles randomly on the network
+        :param nr_vehicles: number of vehicles : int
+        :param nr_nodes: number of nodes, nr_vehicles / 20 (at least 4) if None : int
+        :param seed: seed of the random number generator : int
+        :param dispatch_algorithm: dispatch algorithm of the fake sumo, "traci" or one of sumo's own : String
+        """
+        self.rng = np.random.default_rng(seed)
+        self.nr_nodes = max(4, nr_vehicles // 20) if nr_nodes is None else nr_nodes
+        self.edge_ids = ["st%s" % i for i in range(self.nr_nodes)] + ["ramp%s" % i for i in range(self.nr_nodes)]
+        self.edge_index = {edge: i for i, edge in enumerate(self.edge_ids)}
+        self.lengths = np.array([ST_LENGTH] * self.nr_nodes + [RAMP_LENGTH] * self.nr_nodes)
+        self.vids = ["prt_%s" % i for i in range(nr_vehicles)]
+        self.veh_index = {vid: i for i, vid in enumerate(self.vids)}
+        self.veh_edge = self.rng.integers(0, 2 * self.nr_nodes, nr_vehicles)
+        self.pos = self.rng.uniform(0, self.lengths[self.veh_edge])
+        self.speed = np.full(nr_vehicles, SPEED)
+        self.odometer = np.zeros(nr_vehicles)
+        self.turns = self.rng.random((nr_vehicles, 64)) < 0.3
+        self.hops = np.zeros(nr_vehicles, dtype=int)
+        self.taxi_state = self.rng.choice([0, 1, 2], nr_vehicles, p=[0.4, 0.3, 0.3])
+        self.parked = np.zeros(nr_vehicles, dtype=bool)
+        self.edge_subscriptions = set()
+        self.vehicle_subscriptions = set()
+        self.reservations = {}
+        self.nr_reservations = 0
+        self.persons = {}
+        self.dispatch_algorithm = dispatch_algorithm
+        self.time = 0.
+        self.calls = collections.Counter()
+        self.vehicle = _Vehicle(self)
+        self.edge = _Edge(self)
+        self.lane = _Lane(self)
+        self.trafficlight = _TrafficLight(self)
+        self.parkingarea = _ParkingArea(self)
+        self.person = _Person(self)
+        self.simulation = _Simulation(self)
+        self.vehicletype = _VehicleType(self)
+
+    def distance_table(self):
+        """
+        :return: the shortest distances between all edges of the network : DistanceTable
+        """
+        n = self.nr_nodes
+        # edge i (st or ramp) leads from node i-1 to node i
+        arrival_node = np.arange(2 * n) % n
+        departure_node = (np.arange(2 * n) - 1) % n
+        hops = (departure_node[np.newaxis, :] - arrival_node[:, np.newaxis]) % n
+        return prt_network.DistanceTable(self.edge_ids, self.lengths, hops * min(ST_LENGTH, RAMP_LENGTH))
+
+    def simulationStep(self):
+        """
+        moves the vehicles by one second. Vehicles at the end of their edge pass the node to one of its two outgoing
+        edges, some empty vehicles get customers and some occupied ones drop them off
+        :return:
+        """
+        self.calls["simulationStep"] += 1
+        self.time += 1.
+        moving = ~self.parked
+        # vehicles slowed down by a compressor still creep on, so that they reach the merge
+        self.pos[moving] += np.maximum(self.speed[moving], 1.)
+        self.odometer[moving] += np.maximum(self.speed[moving], 1.)
+        passed = np.flatnonzero(self.pos > self.lengths[self.veh_edge])
+        self.pos[passed] -= self.lengths[self.veh_edge[passed]]
+        node = self.veh_edge[passed] % self.nr_nodes
+        to_ramp = self.turns[passed, self.hops[passed] % self.turns.shape[1]]
+        self.hops[passed] += 1
+        self.veh_edge[passed] = (node + 1) % self.nr_nodes + to_ramp * self.nr_nodes
+        self.pos[passed] = np.minimum(self.pos[passed], self.lengths[self.veh_edge[passed]] - 1.)
+        self.speed[passed] = SPEED
+        switch = self.rng.random(len(self.vids)) < 0.01
+        self.taxi_state[switch & (self.taxi_state == 2)] = 0
+        self.taxi_state[switch & (self.taxi_state == 1)] = 2
+        self.parked[self.taxi_state != 0] = False
+        for pid in [pid for pid, vid in self.persons.items() if vid and self.rng.random() < 0.01]:
+            del self.persons[pid]
+        if self.dispatch_algorithm != "traci":
+            for rid in [rid for rid in self.reservations if self.rng.random() < 0.05]:
+                del self.reservations[rid]
+                self.persons[rid] = self.vids[self.rng.integers(len(self.vids))]
+        return
+
+    def new_reservations(self, nr_reservations):
+        """
+        opens new reservations at random edges
+        :param nr_reservations: number of reservations : int
+        :return:
+        """
+        for edge in self.rng.integers(0, 2 * self.nr_nodes, nr_reservations):
+            rid = str(self.nr_reservations)
+            to_edge = self.edge_ids[(edge + 2) % len(self.edge_ids)]
+            self.reservations[rid] = Reservation(rid, self.edge_ids[edge], to_edge,
+                                                 float(self.rng.uniform(0, self.lengths[edge])), self.time, 1)
+            self.persons[rid] = ""
+            self.nr_reservations += 1
+        return
+
+    def route(self, index, length=8):
+        """
+        :param index: index of the vehicle : int
+        :param length: number of edges : int
+        :return: the current and the next edges of the vehicle : tuple
+        """
+        edge = self.veh_edge[index]
+        route = [self.edge_ids[edge]]
+        for hop in range(self.hops[index], self.hops[index] + length - 1):
+            edge = (edge % self.nr_nodes + 1) % self.nr_nodes + self.turns[index, hop % self.turns.shape[1]] * \
+                self.nr_nodes
+            route.append(self.edge_ids[edge])
+        return tuple(route)
+
+    def parking_edge(self, parking_area):
+        """
+        :param parking_area: ID of the parking area, "pa<i>" or "depot" : String
+        :return: index of the edge of the parking area : int
+        """
+        return self.edge_index["st0"] if parking_area == "depot" else self.edge_index["ramp" + parking_area[2:]]
+
+    def close(self):
+        return
+
+
+class _Domain:
+    """
+    base class of the fake domains, counts the calls of the benchmarked code
+    """
+    name = ""
+
+    def __init__(self, world):
+        self.world = world
+
+    def _count(self, method):
+        self.world.calls[self.name + "." + method] += 1
+
+
+class _Vehicle(_Domain):
+    name = "vehicle"
+
+    def getIDList(self):
+        self._count("getIDList")
+        return tuple(self.world.vids)
+
+    def getTaxiFleet(self, flag):
+        self._count("getTaxiFleet")
+        return [self.world.vids[i] for i in np.flatnonzero(self.world.taxi_state == flag)]
+
+    def isStoppedParking(self, vid):
+        self._count("isStoppedParking")
+        return bool(self.world.parked[self.world.veh_index[vid]])
+
+    def getStops(self, vid, limit=0):
+        self._count("getStops")
+        # only the parking stops of the parked vehicles are known
+        world = self.world
+        index = world.veh_index[vid]
+        if not world.parked[index]:
+            return ()
+        edge = world.veh_edge[index]
+        return (StopData("depot" if edge == world.edge_index["st0"] else "pa%s" % (edge - world.nr_nodes)),)
+
+    def getRoadID(self, vid):
+        self._count("getRoadID")
+        return self.world.edge_ids[self.world.veh_edge[self.world.veh_index[vid]]]
+
+    def getLaneID(self, vid):
+        self._count("getLaneID")
+        return self.getRoadID(vid) + "_0"
+
+    def getLanePosition(self, vid):
+        self._count("getLanePosition")
+        return float(self.world.pos[self.world.veh_index[vid]])
+
+    def getSpeed(self, vid):
+        self._count("getSpeed")
+        return float(self.world.speed[self.world.veh_index[vid]])
+
+    def getDistance(self, vid):
+        self._count("getDistance")
+        return float(self.world.odometer[self.world.veh_index[vid]])
+
+    def setSpeed(self, vid, speed):
+        self._count("setSpeed")
+        self.world.speed[self.world.veh_index[vid]] = speed
+
+    def setSpeedMode(self, vid, mode):
+        self._count("setSpeedMode")
+
+    def setColor(self, vid, color):
+        self._count("setColor")
+
+    def changeTarget(self, vehID, edgeID):
+        self._count("changeTarget")
+
+    def setParkingAreaStop(self, vehID, stopID, duration=None, flags=None):
+        self._count("setParkingAreaStop")
+        # the vehicle parks right away, so the station occupancy fills up
+        world = self.world
+        index = world.veh_index[vehID]
+        world.parked[index] = True
+        world.veh_edge[index] = world.parking_edge(stopID)
+        world.pos[index] = 0.
+
+    def resume(self, vid):
+        self._count("resume")
+        self.world.parked[self.world.veh_index[vid]] = False
+
+    def dispatchTaxi(self, vid, reservations):
+        self._count("dispatchTaxi")
+        for rid in reservations:
+            del self.world.reservations[rid]
+            self.world.persons[rid] = vid
+        index = self.world.veh_index[vid]
+        self.world.taxi_state[index] = 1
+        self.world.parked[index] = False
+
+    def subscribe(self, vid, variables):
+        self._count("subscribe")
+        self.world.vehicle_subscriptions.add(vid)
+
+    def unsubscribe(self, vid):
+        self._count("unsubscribe")
+        self.world.vehicle_subscriptions.discard(vid)
+
+    def getAllSubscriptionResults(self):
+        self._count("getAllSubscriptionResults")
+        world = self.world
+        results = {}
+        for vid in world.vehicle_subscriptions:
+            i = world.veh_index[vid]
+            results[vid] = {tc.VAR_SPEED: float(world.speed[i]), tc.VAR_LANEPOSITION: float(world.pos[i]),
+                            tc.VAR_ROAD_ID: world.edge_ids[world.veh_edge[i]], tc.VAR_ROUTE_INDEX: 0,
+                            tc.VAR_EDGES: world.route(i)}
+        return results
+
+
+class _Edge(_Domain):
+    name = "edge"
+
+    def getIDList(self):
+        self._count("getIDList")
+        return tuple(self.world.edge_ids)
+
+    def getLaneNumber(self, edge):
+        self._count("getLaneNumber")
+        return 1
+
+    def subscribe(self, edge, variables):
+        self._count("subscribe")
+        self.world.edge_subscriptions.add(edge)
+
+    def getAllSubscriptionResults(self):
+        self._count("getAllSubscriptionResults")
+        world = self.world
+        order = np.argsort(world.veh_edge, kind='stable')
+        bounds = np.searchsorted(world.veh_edge[order], np.arange(len(world.edge_ids) + 1))
+        results = {}
+        for edge in world.edge_subscriptions:
+            i = world.edge_index[edge]
+            results[edge] = {tc.LAST_STEP_VEHICLE_ID_LIST: tuple(world.vids[v] for v in order[bounds[i]:bounds[i + 1]])}
+        return results
+
+
+class _Lane(_Domain):
+    name = "lane"
+
+    def getIDList(self):
+        self._count("getIDList")
+        return tuple(edge + "_0" for edge in self.world.edge_ids)
+
+    def getLength(self, lane):
+        self._count("getLength")
+        return float(self.world.lengths[self.world.edge_index[lane[:-2]]])
+
+    def getEdgeID(self, lane):
+        self._count("getEdgeID")
+        return lane[:-2]
+
+
+class _TrafficLight(_Domain):
+    name = "trafficlight"
+
+    def getIDList(self):
+        self._count("getIDList")
+        return tuple("sz%s" % i for i in range(self.world.nr_nodes))
+
+    def getControlledLinks(self, tl_id):
+        self._count("getControlledLinks")
+        i = int(tl_id[2:])
+        n = (i + 1) % self.world.nr_nodes
+        return [[(incoming + "_0", outgoing + "_0", "")] for incoming in ("st%s" % i, "ramp%s" % i)
+                for outgoing in ("st%s" % n, "ramp%s" % n)]
+
+
+class _ParkingArea(_Domain):
+    name = "parkingarea"
+
+    def getIDList(self):
+        self._count("getIDList")
+        return tuple("pa%s" % i for i in range(self.world.nr_nodes)) + ("depot",)
+
+    def getLaneID(self, parking_area):
+        self._count("getLaneID")
+        return self.world.edge_ids[self.world.parking_edge(parking_area)] + "_0"
+
+    def getVehicleCount(self, parking_area):
+        self._count("getVehicleCount")
+        world = self.world
+        return int(np.count_nonzero(world.parked & (world.veh_edge == world.parking_edge(parking_area))))
+
+
+class _Person(_Domain):
+    name = "person"
+
+    def add(self, personID, edgeID, pos=-1):
+        self._count("add")
+
+    def appendWalkingStage(self, personID, edges, arrivalPos=-1, stopID=""):
+        self._count("appendWalkingStage")
+
+    def appendDrivingStage(self, personID, toEdge, lines, stopID=""):
+        self._count("appendDrivingStage")
+
+    def getTaxiReservations(self, flag=0):
+        self._count("getTaxiReservations")
+        if self.world.dispatch_algorithm != "traci":
+            raise TraCIException("device.taxi.dispatch-algorithm 'traci' has not been loaded")
+        return tuple(self.world.reservations.values())
+
+    def getIDList(self):
+        self._count("getIDList")
+        return tuple(self.world.persons)
+
+    def getStage(self, personID, nextStageIndex=0):
+        self._count("getStage")
+        return Stage(3)
+
+    def getVehicle(self, personID):
+        self._count("getVehicle")
+        return self.world.persons[personID]
+
+
+class _Simulation(_Domain):
+    name = "simulation"
+
+    def getParameter(self, object_id, key):
+        self._count("getParameter")
+        return "5"
+
+    def getTime(self):
+        self._count("getTime")
+        return self.world.time
+
+
+class _VehicleType(_Domain):
+    name = "vehicletype"
+
+    def getMaxSpeed(self, type_id):
+        return SPEED
+
+    def getAccel(self, type_id):
+        return 1.
+
+    def getLength(self, type_id):
+        return 5.
+
+    def getTau(self, type_id):
+        return 1.
@@ -0,0 +1,79 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def solve_assignment(cost):
+    """
+    solves the (rectangular) linear assignment problem: each row is assigned to at most one column and vice versa, so
+    that as many rows/columns as possible are assigned at minimal total cost. Uses scipy if it is installed and a
+    NumPy implementation of the Hungarian algorithm otherwise. Infinite costs mark forbidden pairs, which are never
+    returned.
+    :param cost: cost of assigning each row to each column : numpy array
+    :return: assigned rows : numpy array, assigned columns : numpy array
+    """
+    cost = np.asarray(cost, dtype=float)
+    if cost.size == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    allowed = np.isfinite(cost)
+    if not allowed.any():
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    # forbidden pairs get a cost that is higher than any feasible assignment
+    big = (np.abs(cost[allowed]).max() + 1.) * (min(cost.shape) + 1)
+    finite_cost = np.where(allowed, cost, big)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(finite_cost)
+    elif cost.shape[0] <= cost.shape[1]:
+        rows, cols = _hungarian(finite_cost)
+    else:
+        cols, rows = _hungarian(finite_cost.T)
+    order = np.argsort(rows)
+    rows, cols = rows[order], cols[order]
+    feasible = allowed[rows, cols]
+    return rows[feasible], cols[feasible]
+
+
+def _hungarian(cost):
+    """
+    Hungarian algorithm with shortest augmenting paths (O(n^2 m)), the inner loop over the columns is vectorized
+    :param cost: cost matrix with at most as many rows as columns : numpy array
+    :return: assigned rows : numpy array, assigned columns : numpy array
+    """
+    n, m = cost.shape
+    # potentials and matching, index 0 is a virtual column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_col = np.zeros(m + 1, dtype=int)  # row (1-based) matched to each column, 0 if free
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        row_of_col[0] = i
+        j0 = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of_col[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[row_of_col[used]] += delta
+            v[used] -= delta
+            min_reduced[1:][free] -= delta
+            j0 = j1
+            if row_of_col[j0] == 0:
+                break
+        # augment along the alternating path
+        while j0 != 0:
+            j1 = way[j0]
+            row_of_col[j0] = row_of_col[j1]
+            j0 = j1
+    cols = np.flatnonzero(row_of_col[1:])
+    return row_of_col[1:][cols] - 1, cols
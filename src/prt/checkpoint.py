@@ -0,0 +1,96 @@
+import os
+import pickle
+import random
+import numpy as np
+from prt.connection import TRACI_ERRORS
+
+VERSION = 2
+
+
+def save(session, directory):
+    """
+    saves a checkpoint of a running session: the sumo state via simulation.saveState (with the random number
+    generators of sumo, which the session starts with --save-state.rng) and, in a pickle next to it, the state of the
+    controllers, the trip schedule, the KPIs and the random number generators of python and numpy
+    :param session: the running session, between two steps : Session
+    :param directory: directory of the checkpoints, created if missing : String
+    :return: path of the checkpoint pickle : String
+    """
+    os.makedirs(directory, exist_ok=True)
+    time = session.step / session.step_multiplier
+    path = os.path.join(directory, "checkpoint_%s.pkl" % int(time))
+    sumo_state = "state_%s.xml.gz" % int(time)
+    session.conn.simulation.saveState(os.path.abspath(os.path.join(directory, sumo_state)))
+    state = {'version': VERSION, 'step': session.step, 'time': time, 'sumo_state': sumo_state,
+             'compressors': {compressor.id: compressor.get_state() for compressor in session.compressors},
+             'corridor': session.corridor.get_state() if session.corridor is not None else None,
+             'fleet': session.fleet.get_state(),
+             'trips': session.trips.get_state(),
+             'kpis': session.kpis.get_state() if session.kpis is not None else None,
+             'dispatch_due': session.dispatch_due,
+             'rebalance_due': session.rebalance_due,
+             'random': random.getstate(),
+             'numpy_random': np.random.get_state()}
+    # written to a temporary file first, so an interrupted run never leaves a broken checkpoint behind
+    with open(path + ".tmp", 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load(path):
+    """
+    reads a checkpoint
+    :param path: path of the checkpoint pickle written by save : String
+    :return: the saved state, with the absolute path of the sumo state : dictionary
+    """
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != VERSION:
+        raise ValueError("%s is not a checkpoint of version %s" % (path, VERSION))
+    state['sumo_state'] = os.path.join(os.path.dirname(os.path.abspath(path)), state['sumo_state'])
+    return state
+
+
+def restore(session, state):
+    """
+    restores the controllers of a session that was set up on the loaded sumo state. The subscriptions are not part of
+    the checkpoint, the session subscribes the edges in its setup and the vehicles in its first step again. Compressors
+    and options may differ from the checkpointed run, e.g. to fork a scenario with another strategy.
+    :param session: the session, after its setup : Session
+    :param state: the state returned by load : dictionary
+    :return:
+    """
+    session.step = state['step']
+    for compressor in session.compressors:
+        if compressor.id in state['compressors']:
+            compressor.set_state(state['compressors'][compressor.id])
+    if session.corridor is not None and state['corridor'] is not None:
+        session.corridor.set_state(state['corridor'])
+    session.fleet.set_state(state['fleet'])
+    session.trips.set_state(state['trips'])
+    if session.kpis is not None and state['kpis'] is not None:
+        session.kpis.set_state(state['kpis'])
+    session.dispatch_due = state['dispatch_due']
+    session.rebalance_due = state['rebalance_due']
+    random.setstate(state['random'])
+    np.random.set_state(state['numpy_random'])
+    # the speeds set by the controllers are sent again, in case the sumo state does not keep them
+    served = set()
+    for compressor in session.compressors:
+        # read from the store directly, the cars_v property builds a new dictionary on every access
+        target_speeds = compressor.store.data['target_speed']
+        for vid, handle in compressor.handles.items():
+            served.add(vid)
+            try:
+                compressor.send_speed_commands([(vid, float(target_speeds[handle]))])
+            except TRACI_ERRORS:
+                pass
+    if session.corridor is not None:
+        for vid, cruise_speed in session.corridor.cruise_speeds.items():
+            if vid not in served and session.corridor.pending.get(vid, 0) > 0:
+                try:
+                    session.conn.vehicle.setSpeed(vid, cruise_speed)
+                except TRACI_ERRORS:
+                    pass
+    return
@@ -0,0 +1,41 @@
+# the simulation backends the PRT controllers can run on. All controllers take a connection object, which is either the
+# traci module (its current connection), a labelled traci connection or the libsumo module. They share the same API.
+try:
+    import traci
+except ImportError:
+    traci = None
+try:
+    import libsumo
+except ImportError:
+    libsumo = None
+
+
+class TraCIException(Exception):
+    """
+    raised by backends that are neither traci nor libsumo
+    """
+    pass
+
+
+# exceptions raised by the backends when a command fails
+TRACI_ERRORS = tuple([TraCIException] + ([traci.exceptions.TraCIException] if traci is not None else []) +
+                     ([libsumo.TraCIException] if libsumo is not None else []))
+
+
+def start(cmd, backend="traci", label="default", port=None):
+    """
+    starts sumo and connects to it
+    :param cmd: sumo command line, beginning with the binary : list
+    :param backend: "traci" (socket connection, works with sumo-gui) or "libsumo" (sumo runs inside this process, only
+    one simulation per process) : String
+    :param label: label of the traci connection : String
+    :param port: port of the traci connection, a free one if None : int
+    :return: the connection : traci Connection or libsumo module
+    """
+    if backend == "libsumo":
+        if libsumo is None:
+            raise ImportError("libsumo is not available, add $SUMO_HOME/tools to the python path")
+        libsumo.start(cmd)
+        return libsumo
+    traci.start(cmd, port=port, label=label)
+    return traci.getConnection(label)
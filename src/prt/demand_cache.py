@@ -0,0 +1,152 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+import numpy as np
+from prt import utils
+
+# parameters of the trip generation, part of the key of each scenario. Raise the version whenever trips_from_layout
+# draws other trips for the same ODM and seed, so the outdated scenarios are not loaded anymore.
+GENERATOR = {'name': 'trips_from_layout', 'version': 1}
+
+
+class ZoneColumn:
+    """
+    a column of zone names of a cached scenario, stored as the index of each zone and only decoded where it is read
+    Attributes:
+        codes: index of the zone of each trip, may be memory-mapped : numpy array
+        zones: names of the zones : list
+    """
+    def __init__(self, codes, zones):
+        """
+        initializer of the class
+        :param codes: index of the zone of each trip : numpy array
+        :param zones: names of the zones : list
+        """
+        self.codes = codes
+        self.zones = zones
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.zones[code] for code in self.codes[index].tolist()]
+        return self.zones[int(self.codes[index])]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def file_hash(path):
+    """
+    :param path: path to a file : String
+    :return: sha256 of the content of the file : String
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scenario_key(odm_path, seed, generator=GENERATOR):
+    """
+    the key of a scenario only depends on the content of the ODM, not on its path or modification time
+    :param odm_path: path to the ODM csv : String
+    :param seed: seed of the trip generation : Integer
+    :param generator: parameters of the trip generation : dictionary
+    :return: key of the scenario, also the name of its directory in the cache : String
+    """
+    if seed is None:
+        raise ValueError("only seeded demand can be cached")
+    description = json.dumps({'odm': file_hash(odm_path), 'seed': int(seed), 'generator': generator}, sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()[:24]
+
+
+def generate(odm_path, seed, cache_dir):
+    """
+    generates the trips of an ODM and seed into the cache, unless they are cached already. Each scenario is a directory
+    with one .npy file per column, the trips sorted by departure time, and the zone names in scenario.json.
+    :param odm_path: path to the ODM csv : String
+    :param seed: seed of the trip generation : Integer
+    :param cache_dir: directory of the cache, created if missing : String
+    :return: directory of the scenario : String
+    """
+    key = scenario_key(odm_path, seed)
+    scenario = os.path.join(cache_dir, key)
+    if os.path.isfile(os.path.join(scenario, "scenario.json")):
+        return scenario
+    origins, destinations, volumes, scaling_factors = utils.odm_layout(utils.df_from_csv(odm_path))
+    departures, rows, cols = utils.trips_from_layout(volumes, scaling_factors, seed)
+    # stable, so the order is the same as in a TripSchedule built from trips_from_ODM
+    order = np.argsort(departures, kind='stable')
+    os.makedirs(cache_dir, exist_ok=True)
+    # written to a temporary directory first, so concurrent or interrupted runs never leave a broken scenario behind
+    tmp = tempfile.mkdtemp(prefix=key + ".", dir=cache_dir)
+    np.save(os.path.join(tmp, "departures.npy"), departures[order].astype(np.int32))
+    np.save(os.path.join(tmp, "origins.npy"), rows[order].astype(np.min_scalar_type(len(origins))))
+    np.save(os.path.join(tmp, "destinations.npy"), cols[order].astype(np.min_scalar_type(len(destinations))))
+    np.save(os.path.join(tmp, "pickups.npy"), utils.trip_counts(volumes, scaling_factors).sum(axis=2))
+    with open(os.path.join(tmp, "scenario.json"), 'w') as f:
+        json.dump({'odm': os.path.abspath(odm_path), 'seed': int(seed), 'generator': GENERATOR,
+                   'trips': len(departures), 'origins': origins, 'destinations': destinations}, f)
+    try:
+        os.rename(tmp, scenario)
+    except OSError:  # cached by another process in the meantime
+        shutil.rmtree(tmp)
+    return scenario
+
+
+def read_scenario(scenario):
+    """
+    :param scenario: directory of the scenario : String
+    :return: content of scenario.json : dictionary
+    """
+    with open(os.path.join(scenario, "scenario.json")) as f:
+        return json.load(f)
+
+
+def load_trips(scenario):
+    """
+    loads the trips of a cached scenario memory-mapped, so only the trips that are spawned are read from disk
+    :param scenario: directory of the scenario : String
+    :return: the trip schedule : TripSchedule
+    """
+    description = read_scenario(scenario)
+    trips = utils.TripSchedule.from_sorted(
+        np.load(os.path.join(scenario, "departures.npy"), mmap_mode='r'),
+        ZoneColumn(np.load(os.path.join(scenario, "origins.npy"), mmap_mode='r'), description['origins']),
+        ZoneColumn(np.load(os.path.join(scenario, "destinations.npy"), mmap_mode='r'), description['destinations']))
+    return trips
+
+
+def load_forecast(scenario):
+    """
+    :param scenario: directory of the scenario : String
+    :return: the forecast of the pickups of the ODM of the scenario : DemandForecast
+    """
+    return utils.DemandForecast(read_scenario(scenario)['origins'], np.load(os.path.join(scenario, "pickups.npy")))
+
+
+def get_options(args=None):
+    argParser = argparse.ArgumentParser(description="generates the demand scenarios of an ODM and a list of seeds into "
+                                                    "the demand cache. Run from the src directory: "
+                                                    "python -m prt.demand_cache --seeds 1,2,3")
+    argParser.add_argument("--odm", default=os.path.join("cfg", "odm.csv"), help="path to the ODM csv")
+    argParser.add_argument("--seeds", default="42", help="comma separated list of seeds")
+    argParser.add_argument("--cache-dir", default="demand_cache", help="directory of the demand cache")
+    return argParser.parse_args(args)
+
+
+def main(options):
+    for seed in options.seeds.split(","):
+        scenario = generate(options.odm, int(seed), options.cache_dir)
+        print("seed %s: %s trips in %s" % (seed, read_scenario(scenario)['trips'], scenario))
+    return
+
+
+if __name__ == "__main__":
+    main(get_options())
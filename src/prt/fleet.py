@@ -0,0 +1,189 @@
+import traci
+from prt import network as prt_network
+from prt.connection import TRACI_ERRORS
+
+IDLE = 'idle'  # empty and neither parked nor on the way to a parking area
+TO_PARK = 'to_park'  # empty and on the way to a parking area it was sent to
+PARKED = 'parked'  # empty and parked
+PICKUP = 'pickup'  # on the way to pick up a customer
+OCCUPIED = 'occupied'  # carrying a customer
+STATES = [IDLE, TO_PARK, PARKED, PICKUP, OCCUPIED]
+
+# taxi states of vehicle.getTaxiFleet and the states they are mapped to
+TAXI_STATES = {1: PICKUP, 2: OCCUPIED, 3: OCCUPIED}
+
+
+class FleetTracker:
+    """
+    a class that keeps track of the state of each taxi of the fleet. It is updated once per step from one getTaxiFleet
+    query per state. Sumo has no query for the changes only, so the ID lists of the whole fleet are still transferred,
+    but they are compared with the ones of the last step and only the taxis that entered or left a list, were sent
+    somewhere by the strategies or are on their way to a parking area are handled and queried further. Rebalancing and
+    dispatch read from it. Taxis whose parking stop was dropped
+    (e.g. an unreachable stop with --ignore-route-errors) are idle again, so they are rebalanced anew.
+    Attributes:
+        conn: connection to the simulation : traci Connection or libsumo
+        network: cache of the static network geometry of the simulation : NetworkCache
+        state: state of each taxi : dictionary
+        members: taxis in each state, as insertion ordered dictionaries used as sets : dictionary
+        target: parking area each taxi in state to_park or parked was sent to : dictionary
+        changed: taxis that changed their state in the last update : list
+        taxi_fleet: IDs returned by getTaxiFleet for each flag in the last update, as list and as set : dictionary
+        marked: taxis whose state was set by the strategies since the last update : set
+    Methods:
+        update
+        vehicles
+        empty
+        en_route_to
+        send_to_park
+        mark_dispatched
+        get_state
+        set_state
+    """
+    def __init__(self, conn=traci, network=None):
+        """
+        initializer of the class, constructs the attributes
+        :param conn: connection to the simulation : traci Connection or libsumo
+        :param network: cache of the static network geometry, the shared one (own one on other connections) if None :
+        NetworkCache
+        """
+        if network is None:
+            network = prt_network.shared() if conn is traci else prt_network.NetworkCache(conn)
+        self.conn = conn
+        self.network = network
+        self.state = {}
+        self.members = {state: {} for state in STATES}
+        self.target = {}
+        self.changed = []
+        self.taxi_fleet = {}
+        self.marked = set()
+
+    def _set_state(self, vid, state, target=None):
+        """
+        moves a taxi to a new state
+        :param vid: ID of the taxi : String
+        :param state: new state, None removes the taxi : String
+        :param target: parking area of the states to_park and parked : String
+        :return:
+        """
+        old_state = self.state.get(vid)
+        if old_state is not None:
+            del self.members[old_state][vid]
+        self.target.pop(vid, None)
+        if state is None:
+            del self.state[vid]
+        else:
+            self.state[vid] = state
+            self.members[state][vid] = None
+            if target is not None:
+                self.target[vid] = target
+        if old_state != state:
+            self.changed.append(vid)
+        return
+
+    def update(self):
+        """
+        updates the states of all taxis, has to be called once per step before the states are read
+        :return:
+        """
+        self.changed = []
+        # only the taxis that entered or left one of the lists can have changed their state in sumo
+        candidates = self.marked
+        self.marked = set()
+        if not self.taxi_fleet:
+            candidates.update(self.state)
+        for flag in [0] + list(TAXI_STATES):
+            vids = self.conn.vehicle.getTaxiFleet(flag)
+            old_vids, old_members = self.taxi_fleet.get(flag, ((), set()))
+            if vids != old_vids:
+                members = set(vids)
+                candidates.update(members.symmetric_difference(old_members))
+                self.taxi_fleet[flag] = (vids, members)
+        for vid in candidates:
+            state = None
+            for flag in [0] + list(TAXI_STATES):
+                if vid in self.taxi_fleet[flag][1]:
+                    state = TAXI_STATES.get(flag, IDLE)
+            old_state = self.state.get(vid)
+            if state is None:
+                if old_state is not None:
+                    self._set_state(vid, None)  # the taxi left the simulation
+            elif state != IDLE:
+                if old_state != state:
+                    self._set_state(vid, state)
+            elif old_state is None or old_state in (PICKUP, OCCUPIED):
+                # the taxi just became empty (or is new), check once whether it is parked somewhere
+                self._set_state(vid, PARKED if self.conn.vehicle.isStoppedParking(vid) else IDLE)
+        # taxis on their way to a parking area
+        for vid in list(self.members[TO_PARK]):
+            try:
+                if self.conn.vehicle.isStoppedParking(vid):
+                    self._set_state(vid, PARKED, self.target[vid])
+                elif all(stop.stoppingPlaceID != self.target[vid] for stop in self.conn.vehicle.getStops(vid)):
+                    self._set_state(vid, IDLE)
+            except TRACI_ERRORS:
+                pass
+        return
+
+    def vehicles(self, state):
+        """
+        :param state: the state : String
+        :return: IDs of the taxis in the state : list
+        """
+        return list(self.members[state])
+
+    def empty(self):
+        """
+        :return: IDs of all taxis without customer, i.e. idle, on their way to park or parked : list
+        """
+        return self.vehicles(IDLE) + self.vehicles(TO_PARK) + self.vehicles(PARKED)
+
+    def en_route_to(self, parking_area):
+        """
+        :param parking_area: ID of the parking area : String
+        :return: IDs of the taxis on their way to the parking area : list
+        """
+        return [vid for vid in self.members[TO_PARK] if self.target[vid] == parking_area]
+
+    def send_to_park(self, vid, parking_area):
+        """
+        records that a taxi was sent to a parking area
+        :param vid: ID of the taxi : String
+        :param parking_area: ID of the parking area : String
+        :return:
+        """
+        self._set_state(vid, TO_PARK, parking_area)
+        self.marked.add(vid)
+        return
+
+    def mark_dispatched(self, vid):
+        """
+        records that a taxi was dispatched to a customer, before sumo reports it in the next step
+        :param vid: ID of the taxi : String
+        :return:
+        """
+        self._set_state(vid, PICKUP)
+        self.marked.add(vid)
+        return
+
+    def get_state(self):
+        """
+        :return: the states of the taxis and the parking areas they were sent to, e.g. for a checkpoint : dictionary
+        """
+        return {'members': {state: list(members) for state, members in self.members.items()},
+                'target': dict(self.target)}
+
+    def set_state(self, state):
+        """
+        restores the states of the taxis returned by get_state
+        :param state: the state : dictionary
+        :return:
+        """
+        self.members = {member_state: dict.fromkeys(state['members'].get(member_state, ())) for member_state in STATES}
+        self.state = {vid: member_state for member_state, members in self.members.items() for vid in members}
+        self.target = dict(state['target'])
+        self.changed = []
+        # the next update compares all taxis with sumo again
+        self.taxi_fleet = {}
+        self.marked = set()
+        return
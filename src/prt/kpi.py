@@ -0,0 +1,381 @@
+import os
+import csv
+import numpy as np
+from prt.connection import TRACI_ERRORS
+from prt.fleet import OCCUPIED
+
+# reservation states of getTaxiReservations
+PICKED_UP = 8
+# stage type of a ride, as in traci.constants
+STAGE_DRIVING = 3
+
+KPI_FIELDS = ['begin', 'end', 'kpi', 'key', 'count', 'mean', 'min', 'max', 'sum']
+# attributes of KPICollector that are aggregated during the run
+KPI_STATE = ['histograms', 'bin_begin', 'bin_values', 'rows', 'last_flush', 'nr_parts', 'nr_rows', 'last_sample',
+             'waiting', 'riding', 'distances', 'empty_distance', 'total_distance', 'bin_distances']
+
+
+class RunningHistogram:
+    """
+    a class that aggregates a stream of values into a histogram with fixed bins, so its memory does not grow with the
+    number of values. Values above the last bin are counted in an overflow bin.
+    Attributes:
+        bin_width: width of each bin : float
+        counts: number of values in each bin, the last one is the overflow bin : numpy array
+        count: number of values : int
+        total: sum of the values : float
+        minimum: smallest value : float
+        maximum: largest value : float
+    Methods:
+        add
+        mean
+        percentile
+    """
+    def __init__(self, bin_width, nr_bins):
+        """
+        initializer of the class
+        :param bin_width: width of each bin : float
+        :param nr_bins: number of bins : int
+        """
+        self.bin_width = bin_width
+        self.counts = np.zeros(nr_bins + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+
+    def add(self, values):
+        """
+        adds values to the histogram
+        :param values: the values : float or numpy array
+        :return:
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if len(values) == 0:
+            return
+        bins = np.clip((values / self.bin_width).astype(int), 0, len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        return
+
+    def mean(self):
+        """
+        :return: mean of the values, nan if there are none : float
+        """
+        return self.total / self.count if self.count else float("nan")
+
+    def percentile(self, q):
+        """
+        :param q: percentile between 0 and 100 : float
+        :return: upper edge of the bin containing the percentile, the maximum for the overflow bin : float
+        """
+        if self.count == 0:
+            return float("nan")
+        b = int(np.searchsorted(np.cumsum(self.counts), q / 100. * self.count))
+        return self.maximum if b >= len(self.counts) - 1 else min((b + 1) * self.bin_width, self.maximum)
+
+
+class KPICollector:
+    """
+    a class that collects KPIs during the simulation: the wait and ride times of the passengers (from the state changes
+    of their reservations, or of their stages if sumo dispatches the taxis itself), the share of the driven distance
+    without passenger, the occupancy of the stations and the merge delay of each compressor (time between the desired
+    arrival and the assigned slot). Each KPI is aggregated in a running histogram over the whole run and in time bins,
+    which are written to a csv (or Parquet files) periodically.
+    Attributes:
+        conn: connection to the simulation : traci Connection or libsumo
+        fleet: fleet state, updated by the caller : FleetTracker
+        stations: IDs of the parking areas whose occupancy is recorded : list
+        reservations: whether the reservations can be queried, i.e. sumo dispatches via traci : bool
+        histograms: running histogram of each KPI and key (station, compressor or "") : dictionary
+        bin_length: length of the time bins in seconds : float
+        bin_begin: begin of the current time bin : float
+        bin_values: count, sum, min and max of each KPI and key in the current time bin : dictionary
+        rows: rows of the finished time bins not written yet : list
+        path: csv or .parquet file the time bins are written to, None to keep them in memory only : String
+        flush_period: interval between two flushes in seconds : float
+        sample_period: interval between two samples of the driven distances and station occupancies : float
+        waiting: time each open reservation (or person) was made, until its pickup : dictionary
+        riding: pickup time of each picked up reservation (or person) : dictionary
+        distances: driven distance of each taxi at its last sample : dictionary
+        empty_distance: distance driven without passenger : float
+        total_distance: distance driven in total : float
+        bin_distances: distance driven without passenger and in total in the current time bin : list
+        last_flush: time of the last flush : float
+        nr_parts: number of Parquet part files written : int
+        nr_rows: number of rows written to the csv : int
+        last_sample: time of the last sample, None before the first one : float
+    Methods:
+        add
+        add_merge_delays
+        update
+        update_passengers
+        person_requests
+        update_distances
+        bin_rows
+        flush
+        summary
+        close
+        get_state
+        set_state
+    """
+    def __init__(self, conn, fleet, stations, path=None, bin_length=900., flush_period=3600., sample_period=10.,
+                 reservations=True):
+        """
+        initializer of the class, constructs the attributes
+        :param conn: connection to the simulation : traci Connection or libsumo
+        :param fleet: fleet state, updated by the caller before each update : FleetTracker
+        :param stations: IDs of the parking areas whose occupancy is recorded : list
+        :param path: csv or .parquet file the time bins are written to, None to keep them in memory only : String
+        :param bin_length: length of the time bins in seconds : float
+        :param flush_period: interval between two flushes in seconds : float
+        :param sample_period: interval between two samples of the driven distances and station occupancies : float
+        :param reservations: whether sumo dispatches via traci. Otherwise sumo refuses getTaxiReservations and the
+        wait and ride times are taken from the stages of the persons : bool
+        """
+        self.conn = conn
+        self.fleet = fleet
+        self.stations = list(stations)
+        self.reservations = reservations
+        self.histograms = {}
+        self.bin_length = bin_length
+        self.bin_begin = 0.
+        self.bin_values = {}
+        self.rows = []
+        self.path = path
+        self.flush_period = flush_period
+        self.last_flush = 0.
+        self.nr_parts = 0
+        self.nr_rows = 0
+        self.sample_period = sample_period
+        self.last_sample = None
+        self.waiting = {}
+        self.riding = {}
+        self.distances = {}
+        self.empty_distance = 0.
+        self.total_distance = 0.
+        self.bin_distances = [0., 0.]
+        if path is not None and path.endswith(".parquet"):
+            import pandas as pd
+            pd.io.parquet.get_engine("auto")  # fails at the start instead of the first flush if pyarrow is missing
+
+    def add(self, kpi, values, key="", bin_width=10., nr_bins=360):
+        """
+        adds values of a KPI to its running histogram and the current time bin
+        :param kpi: name of the KPI : String
+        :param values: the values : float or numpy array
+        :param key: station, compressor or "" : String
+        :param bin_width: bin width of the histogram, if it is new : float
+        :param nr_bins: number of bins of the histogram, if it is new : int
+        :return:
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if len(values) == 0:
+            return
+        if (kpi, key) not in self.histograms:
+            self.histograms[(kpi, key)] = RunningHistogram(bin_width, nr_bins)
+        self.histograms[(kpi, key)].add(values)
+        count, total, minimum, maximum = self.bin_values.get((kpi, key), (0, 0., float("inf"), float("-inf")))
+        self.bin_values[(kpi, key)] = (count + len(values), total + float(values.sum()),
+                                       min(minimum, float(values.min())), max(maximum, float(values.max())))
+        return
+
+    def add_merge_delays(self, compressor_id, delays):
+        """
+        records the merge delays of the vehicles a compressor has just served
+        :param compressor_id: ID of the compressor : String
+        :param delays: time between the desired arrival and the assigned slot in seconds : numpy array
+        :return:
+        """
+        self.add("merge_delay", np.maximum(delays, 0.), compressor_id, bin_width=0.5, nr_bins=120)
+        return
+
+    def update(self, time):
+        """
+        collects the KPIs of the current second, has to be called after the fleet state was updated
+        :param time: simulation time in seconds : float
+        :return:
+        """
+        if time >= self.bin_begin + self.bin_length:
+            self.bin_rows(time)
+        self.update_passengers(time)
+        if self.last_sample is None or time >= self.last_sample + self.sample_period:
+            self.last_sample = time
+            self.update_distances()
+            for station in self.stations:
+                self.add("station_occupancy", self.conn.parkingarea.getVehicleCount(station), station, 1., 100)
+        if self.path is not None and time >= self.last_flush + self.flush_period:
+            self.last_flush = time
+            self.flush()
+        return
+
+    def update_passengers(self, time):
+        """
+        records the wait time of the passengers that were picked up and the ride time of the delivered ones
+        :param time: simulation time in seconds : float
+        :return:
+        """
+        waits = []
+        rides = []
+        open_reservations = set()
+        if self.reservations:
+            requests = [(reservation.id, reservation.reservationTime, reservation.state & PICKED_UP)
+                        for reservation in self.conn.person.getTaxiReservations(0)]
+        else:
+            requests = self.person_requests(time)
+        for rid, reservation_time, picked_up in requests:
+            open_reservations.add(rid)
+            if picked_up:
+                if rid not in self.riding:
+                    waits.append(time - self.waiting.pop(rid, reservation_time))
+                    self.riding[rid] = time
+            elif rid not in self.waiting:
+                self.waiting[rid] = reservation_time
+        # reservations that are gone were delivered (or cancelled before the pickup)
+        for rid in [rid for rid in self.riding if rid not in open_reservations]:
+            rides.append(time - self.riding.pop(rid))
+        for rid in [rid for rid in self.waiting if rid not in open_reservations]:
+            del self.waiting[rid]
+        self.add("wait_time", waits)
+        self.add("ride_time", rides)
+        return
+
+    def person_requests(self, time):
+        """
+        the taxi requests of the persons, for runs in which sumo dispatches the taxis and keeps its reservations to
+        itself. A person requests a taxi when it starts its ride stage and is picked up when it is in a vehicle. Only
+        the persons that are not riding yet are queried.
+        :param time: simulation time in seconds : float
+        :return: (person ID, request time, whether picked up) of each person that waits for or rides a taxi : list
+        """
+        requests = []
+        for pid in self.conn.person.getIDList():
+            if pid in self.riding:
+                requests.append((pid, None, True))
+                continue
+            try:
+                if pid not in self.waiting and self.conn.person.getStage(pid).type != STAGE_DRIVING:
+                    continue  # still walking to the station
+                requests.append((pid, time, self.conn.person.getVehicle(pid) != ""))
+            except TRACI_ERRORS:
+                pass
+        return requests
+
+    def update_distances(self):
+        """
+        samples the driven distance of each taxi and attributes the distance since the last sample to driving with or
+        without passenger, according to the state of the taxi at the last sample
+        :return:
+        """
+        distances = {}
+        for vid, state in self.fleet.state.items():
+            try:
+                distances[vid] = (self.conn.vehicle.getDistance(vid), state)
+            except TRACI_ERRORS:
+                pass
+        for vid, (distance, state) in distances.items():
+            if vid in self.distances:
+                last_distance, last_state = self.distances[vid]
+                driven = max(0., distance - last_distance)
+                self.total_distance += driven
+                self.bin_distances[1] += driven
+                if last_state != OCCUPIED:
+                    self.empty_distance += driven
+                    self.bin_distances[0] += driven
+        self.distances = distances
+        return
+
+    def bin_rows(self, time):
+        """
+        closes the current time bin and keeps its rows for the next flush
+        :param time: simulation time in seconds : float
+        :return:
+        """
+        end = self.bin_begin + self.bin_length
+        for (kpi, key), (count, total, minimum, maximum) in sorted(self.bin_values.items()):
+            self.rows.append({'begin': self.bin_begin, 'end': end, 'kpi': kpi, 'key': key, 'count': count,
+                              'mean': total / count, 'min': minimum, 'max': maximum, 'sum': total})
+        if self.bin_distances[1] > 0:
+            # sum: km driven in the bin
+            self.rows.append({'begin': self.bin_begin, 'end': end, 'kpi': 'empty_km_ratio', 'key': '', 'count': 1,
+                              'mean': self.bin_distances[0] / self.bin_distances[1], 'min': None, 'max': None,
+                              'sum': self.bin_distances[1] / 1000.})
+        self.bin_values = {}
+        self.bin_distances = [0., 0.]
+        self.bin_begin = end if time < end + self.bin_length else time - time % self.bin_length
+        return
+
+    def flush(self):
+        """
+        writes the rows of the finished time bins, appended to the csv or as the next Parquet part file
+        :return:
+        """
+        if not self.rows:
+            return
+        if self.path.endswith(".parquet"):
+            import pandas as pd
+            pd.DataFrame(self.rows, columns=KPI_FIELDS).to_parquet("%s.%s.parquet" % (self.path[:-8], self.nr_parts))
+            self.nr_parts += 1
+        else:
+            # the first flush of a run replaces the csv of an earlier run, the later ones append to it
+            write_header = self.nr_rows == 0 or not os.path.isfile(self.path)
+            with open(self.path, 'w' if self.nr_rows == 0 else 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=KPI_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(self.rows)
+            self.nr_rows += len(self.rows)
+        self.rows = []
+        return
+
+    def summary(self):
+        """
+        :return: mean and 95th percentile of the wait and ride time, mean merge delay and empty km ratio : dictionary
+        """
+        summary = {}
+        for kpi in ["wait_time", "ride_time"]:
+            histogram = self.histograms.get((kpi, ""))
+            summary['mean_' + kpi] = histogram.mean() if histogram else float("nan")
+            summary['p95_' + kpi] = histogram.percentile(95) if histogram else float("nan")
+        delays = [h for (kpi, key), h in self.histograms.items() if kpi == "merge_delay"]
+        count = sum(h.count for h in delays)
+        summary['mean_merge_delay'] = sum(h.total for h in delays) / count if count else float("nan")
+        summary['empty_km_ratio'] = self.empty_distance / self.total_distance if self.total_distance else float("nan")
+        return summary
+
+    def close(self, time):
+        """
+        closes the last time bin and writes the remaining rows
+        :param time: simulation time in seconds : float
+        :return:
+        """
+        self.bin_rows(time)
+        if self.path is not None:
+            self.flush()
+        return
+
+    def get_state(self):
+        """
+        :return: the aggregated KPIs and the open reservations, e.g. for a checkpoint : dictionary
+        """
+        return {name: getattr(self, name) for name in KPI_STATE}
+
+    def set_state(self, state):
+        """
+        restores the aggregated KPIs returned by get_state. The time bins that were written before are not written
+        again: the csv keeps the rows written up to the checkpoint and loses the ones written after it, which the
+        resumed run writes again. The Parquet parts after the checkpoint are overwritten.
+        :param state: the state : dictionary
+        :return:
+        """
+        for name in KPI_STATE:
+            setattr(self, name, state[name])
+        if self.path is not None and not self.path.endswith(".parquet") and os.path.isfile(self.path):
+            with open(self.path, newline='') as f:
+                lines = list(csv.reader(f))[:self.nr_rows + 1]
+            with open(self.path, 'w', newline='') as f:
+                csv.writer(f).writerows(lines)
+        return
@@ -1,5 +1,14 @@
 import traci
 import math
+import bisect
+import numpy as np
+from prt import network as prt_network
+from prt.subscriptions import SubscriptionManager
+
+# columns of the vehicle store
+VEHICLE_DTYPE = np.dtype([('speed', float), ('distance', float), ('desired', float), ('slot', float),
+                          ('target_speed', float)])
+_shared_store = None
 
 
 def compute_ETA(current_speed, target_speed, distance, acceleration, deceleration):
@@ -13,21 +22,246 @@ def compute_ETA(current_speed, target_speed, distance, acceleration, deceleratio
     :param distance: remaining distance to the corssing point of the intersection : Float
     :param acceleration: maximum acceleration of the vehicle : Float
     :param deceleration: maximum deceleration of the vehicle : Float
+    :return: time of arrival in seconds from now : Float
+    """
+    return float(compute_ETAs(current_speed, target_speed, distance, acceleration, deceleration))
+
+
+def compute_ETAs(current_speeds, target_speeds, distances, accelerations, decelerations):
+    """
+    vectorized version of compute_ETA for all vehicles approaching any compressor. Each vehicle changes its speed with
+    max. acceleration or deceleration until it drives with the target speed. Vehicles which reach the merge point before
+    they reach the target speed arrive while still accelerating or decelerating.
+    :param current_speeds: current speeds of the vehicles : numpy array
+    :param target_speeds: desired speeds of the vehicles : numpy array or Float
+    :param distances: remaining distances to the merge points : numpy array
+    :param accelerations: maximum accelerations of the vehicles : numpy array or Float
+    :param decelerations: maximum decelerations of the vehicles : numpy array or Float
+    :return: times of arrival in seconds from now : numpy array
+    """
+    v0, vt, dist, acc, dec = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                                   (current_speeds, target_speeds, distances, accelerations,
+                                                    decelerations)])
+    accelerating = v0 <= vt
+    rate = np.where(accelerating, acc, -dec)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_change = (vt - v0) / rate
+        dist_change = 0.5 * (v0 + vt) * t_change
+        # the target speed is reached before the merge point: change speed, then drive with constant speed
+        t_reached = t_change + (dist - dist_change) / vt
+        # the merge point is reached while still changing speed: dist = v0 * t + 0.5 * rate * t^2
+        t_changing = (np.sqrt(np.maximum(v0 ** 2 + 2 * rate * dist, 0.)) - v0) / rate
+    return np.where((dist_change <= dist) | (t_change == 0), t_reached, t_changing)
+
+
+def slot_speeds(current_speeds, distances, travel_times, accelerations, decelerations, vmax):
+    """
+    computes the speeds the vehicles have to be set to in order to reach the merge point exactly at their slot. Each
+    vehicle changes from its current speed to the new speed with max. acceleration or deceleration and keeps it until
+    the merge point.
+    :param current_speeds: current speeds of the vehicles : numpy array
+    :param distances: remaining distances to the merge points : numpy array
+    :param travel_times: times until the slots in seconds : numpy array
+    :param accelerations: maximum accelerations of the vehicles : numpy array or Float
+    :param decelerations: maximum decelerations of the vehicles : numpy array or Float
+    :param vmax: maximum speeds of the vehicles : numpy array or Float
+    :return: new speeds of the vehicles : numpy array
+    """
+    v0, dist, t, acc, dec, vmax = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in
+                                                        (current_speeds, distances, travel_times, accelerations,
+                                                         decelerations, vmax)])
+    t = np.maximum(t, 1e-6)
+    # dist = v * t -+ (v - v0)^2 / (2 * rate), solved for the speed change |v - v0|
+    faster = dist > v0 * t
+    rate = np.where(faster, acc, dec)
+    with np.errstate(invalid='ignore'):
+        change = rate * (t - np.sqrt(t ** 2 - 2 * np.abs(dist - v0 * t) / rate))
+    new_speeds = np.where(faster, v0 + change, v0 - change)
+    # slots that cannot be hit exactly fall back to the average speed
+    new_speeds = np.where(np.isnan(new_speeds), dist / t, new_speeds)
+    return np.clip(new_speeds, 0., vmax)
+
+
+def new_vehicles(compressors):
+    """
+    gathers the new vehicles of several compressors, which share one vehicle store
+    :param compressors: the compressors : list
+    :return: handles of the new vehicles back to back, in the order of the compressors : numpy array, number of new
+    vehicles of each compressor : numpy array
+    """
+    counts = np.array([len(compressor.new_handles) for compressor in compressors], dtype=int)
+    handles = np.fromiter((handle for compressor in compressors for handle in compressor.new_handles), dtype=np.intp,
+                          count=int(counts.sum()))
+    return handles, counts
+
+
+def serve_compressors(compressors, step, step_multiplier):
+    """
+    serves the new vehicles of several compressors at once. The desired arrival times and the speeds for the assigned
+    slots of all vehicles are computed in one vectorized call each, on the columns of the shared vehicle store. The
+    slots are assigned by each compressor.
+    :param compressors: the compressors whose new vehicles are served, sharing one vehicle store : list
+    :param step: current simulation step : int
+    :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
     :return:
     """
-    if current_speed <= target_speed:
-        t_acc = (target_speed - current_speed) / acceleration
-        dist_acc = 0.5 * acceleration * t_acc ** 2
-        dist_rem = distance - dist_acc
-        t_v_const = dist_rem / target_speed
-        t_total = t_acc + t_v_const
-    else:
-        t_acc = (target_speed - current_speed) / deceleration
-        dist_acc = 0.5 * deceleration * t_acc ** 2
-        dist_rem = distance - dist_acc
-        t_v_const = dist_rem / target_speed
-        t_total = t_acc + t_v_const
-    return t_total
+    handles, counts = new_vehicles(compressors)
+    if len(handles) == 0:
+        return
+    data = compressors[0].store.data
+    speeds = data['speed'][handles]
+    distances = data['distance'][handles]
+    vmax = np.repeat([compressor.vmax for compressor in compressors], counts)
+    amax = np.repeat([compressor.amax for compressor in compressors], counts)
+    dec_max = np.repeat([compressor.dec_max for compressor in compressors], counts)
+    desired = compute_ETAs(speeds, vmax, distances, amax, dec_max) * step_multiplier + step
+    slots = np.empty(len(handles))
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    for compressor, start, end in zip(compressors, bounds[:-1], bounds[1:]):
+        if end > start:
+            slots[start:end] = compressor.assign_slots(desired[start:end], step_multiplier)
+    new_speeds = slot_speeds(speeds, distances, (slots - step) / step_multiplier, amax, dec_max, vmax)
+    new_speeds = np.where(slots <= desired, vmax, new_speeds)
+    for compressor, start, end in zip(compressors, bounds[:-1], bounds[1:]):
+        if end > start:
+            compressor.finish_serving(desired[start:end], slots[start:end], new_speeds[start:end])
+            if compressor.kpi is not None:
+                compressor.kpi.add_merge_delays(compressor.id,
+                                                (slots[start:end] - desired[start:end]) / step_multiplier)
+    return
+
+
+class SlotTimeline:
+    """
+    a sorted timeline of the time slots reserved at a merge point. Slots are found by binary search, so lookups, inserts
+    and deletes do not need to re-sort or rebuild the reservations. Inserts and deletes shift the list behind the slot,
+    which stays below the binary search up to some 10000 slots, far more than one merge holds within its horizon (see
+    the slot_timeline benchmark).
+    Attributes:
+        slots: reserved time slots, sorted ascending : list
+    Methods:
+        reserve
+        release
+        earliest_slot
+        expire
+    """
+    def __init__(self, slots=()):
+        """
+        initializer of the class
+        :param slots: time slots that are already reserved : iterable
+        """
+        self.slots = sorted(slots)
+
+    def reserve(self, slot):
+        """
+        reserves a time slot
+        :param slot: time of the slot : float
+        :return:
+        """
+        bisect.insort(self.slots, slot)
+        return
+
+    def release(self, slot):
+        """
+        releases a reserved time slot, slots that are not reserved (anymore) are ignored
+        :param slot: time of the slot : float
+        :return:
+        """
+        i = bisect.bisect_left(self.slots, slot)
+        if i < len(self.slots) and self.slots[i] == slot:
+            del self.slots[i]
+        return
+
+    def earliest_slot(self, desired, headway):
+        """
+        finds the earliest slot at or after the desired time which keeps the headway to all reserved slots. Gaps between
+        reserved slots are used if they are wide enough.
+        :param desired: desired time of the slot : float
+        :param headway: minimal time between two slots : float
+        :return: time of the earliest feasible slot : float
+        """
+        slot = desired
+        i = bisect.bisect_right(self.slots, slot - headway)
+        while i < len(self.slots) and self.slots[i] < slot + headway:
+            slot = max(slot, self.slots[i] + headway)
+            i += 1
+        return slot
+
+    def expire(self, before):
+        """
+        deletes all slots before the given time
+        :param before: time before which the slots are deleted : float
+        :return:
+        """
+        del self.slots[:bisect.bisect_left(self.slots, before)]
+        return
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+
+def shared_store():
+    """
+    returns the vehicle store shared by all compressors that are created without one. It is created on first use.
+    :return: the shared vehicle store : VehicleStore
+    """
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = VehicleStore()
+    return _shared_store
+
+
+class VehicleStore:
+    """
+    a compact store of the vehicles served by the compressors, shared by all of them. Each vehicle gets one row of a
+    NumPy structured array per compressor serving it, addressed by an integer handle, so its speed, distance, desired
+    arrival, slot and target speed are read and written in O(1). The columns are NumPy arrays, so the rows of the new
+    vehicles are gathered for the vectorized slot computation without building lists. The rows of vehicles that left
+    are reused, so the store only grows with the number of vehicles served at the same time.
+    Attributes:
+        data: one row per handle : numpy structured array
+        free: handles of the unused rows : list
+    Methods:
+        add
+        remove
+    """
+    def __init__(self, capacity=64):
+        """
+        initializer of the class
+        :param capacity: number of rows allocated at first : int
+        """
+        self.data = np.full(capacity, np.nan, dtype=VEHICLE_DTYPE)
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def add(self, speed, distance):
+        """
+        stores a vehicle entering the v2i zone of a compressor, the store doubles if it is full
+        :param speed: current speed of the vehicle : float
+        :param distance: remaining distance to the merge point : float
+        :return: handle of the vehicle : int
+        """
+        if not self.free:
+            capacity = len(self.data)
+            self.data = np.concatenate([self.data, np.full(capacity, np.nan, dtype=VEHICLE_DTYPE)])
+            self.free = list(range(2 * capacity - 1, capacity - 1, -1))
+        handle = self.free.pop()
+        self.data[handle] = (speed, distance, np.nan, np.nan, np.nan)
+        return handle
+
+    def remove(self, handle):
+        """
+        frees the row of a vehicle that has left the compressor
+        :param handle: handle of the vehicle : int
+        :return:
+        """
+        self.free.append(handle)
+        return
+
+    def __len__(self):
+        return len(self.data) - len(self.free)
 
 
 class Compressor:
@@ -42,21 +276,34 @@ class Compressor:
         dec_max: maximum deceleration of the vehicles driving on the compressor : float
         vehlen: length of the vehicles driving on the compressor : int
         timegap: desired time headway between cars following each other : float
-        blocked_slots: time slots that are already reserved for a vehicle : list
-        served_veh: IDs of vehicles that have already passed the intersection : list
-        cars_slots: slots of cars that have passed the compressor, mainly for debugging : dictionary
-        cars_v: velocities of cars that have passed the compressor, mainly for debugging : dictionary
-        new_veh: vehicles entering the v2i zone : dictionary
+        blocked_slots: time slots that are already reserved for a vehicle : SlotTimeline
+        store: store of the served vehicles, shared by all compressors : VehicleStore
+        handles: handle in the store of each vehicle that was served and has not left the intersection yet : dictionary
+        new_ids: IDs of the vehicles entering the v2i zone in the current step : list
+        new_handles: handles of the vehicles entering the v2i zone in the current step : list
+        served_veh: IDs of vehicles that have already passed the intersection, read only : list
+        cars_slots: slots of cars that have passed the compressor, mainly for debugging, read only : dictionary
+        cars_v: velocities of cars that have passed the compressor, mainly for debugging, read only : dictionary
+        new_veh: vehicles entering the v2i zone with ID, speed, distance and desired arrival, read only : dictionary
         incomings: incoming edges of the compressor : list
         outgoings: outgoing edges of the compressor : list
+        network: cache of the static network geometry : NetworkCache
+        subscriptions: subscription manager providing the vehicle data of each step : SubscriptionManager
+        conn: connection to the simulation : traci Connection or libsumo
+        kpi: collector the merge delays are recorded in, None if not collecting : KPICollector
+        corridor: corridor scheduler the compressor is part of, None if it works on its own : CorridorScheduler
+        pre_reserved: slots reserved by the corridor scheduler for vehicles that have not arrived yet : dictionary
     Methods:
         check_new_veh
         serve_new_veh
         check_served_veh
         clean_blocked_slots
         execution_step
+        get_state
+        set_state
     """
-    def __init__(self, compressor_id, stopline, v2i_range, vmax, amax, timegap, vehlen):
+    def __init__(self, compressor_id, stopline, v2i_range, vmax, amax, timegap, vehlen, subscriptions=None,
+                 network=None, conn=traci, store=None):
         """
         initializer of the class, constructs the attributes
         :param compressor_id: id of the comressor : String
@@ -66,7 +313,15 @@ class Compressor:
         :param amax: maximum acceleration of the vehicles driving on the compressor : float
         :param timegap: desired time headway between cars following each other : float
         :param vehlen: length of the vehicles driving on the compressor : int
+        :param subscriptions: subscription manager shared by all compressors, which is updated once per step by the
+        caller. If None, the compressor creates and updates its own : SubscriptionManager
+        :param network: cache of the static network geometry, the shared one (own one on other connections) if None :
+        NetworkCache
+        :param conn: connection to the simulation : traci Connection or libsumo
+        :param store: store of the served vehicles, the shared one if None. Compressors that are served together
+        have to share their store : VehicleStore
         """
+        self.conn = conn
         self.id = compressor_id
         self.stopline = stopline
         self.v2i_range = v2i_range
@@ -75,12 +330,12 @@ class Compressor:
         self.dec_max = amax  # TODO: remodel parameter
         self.vehlen = vehlen
         self.timegap = timegap
-        self.blocked_slots = []
-        self.served_veh = []
-        self.controlledLinks = traci.trafficlight.getControlledLinks(compressor_id)
-        self.cars_slots = {}
-        self.cars_v = {}
-        self.new_veh = {}
+        self.blocked_slots = SlotTimeline()
+        self.store = shared_store() if store is None else store
+        self.handles = {}
+        self.new_ids = []
+        self.new_handles = []
+        self.controlledLinks = self.conn.trafficlight.getControlledLinks(compressor_id)
         outLinksTemp = []
         inLinksTemp = []
         for link in self.controlledLinks:
@@ -93,101 +348,161 @@ class Compressor:
             self.outgoings[i] = self.outgoings[i][:(len(self.outgoings[i]) - 2)]
         for i in range(len(self.incomings)):
             self.incomings[i] = self.incomings[i][:(len(self.incomings[i]) - 2)]
+        if network is None:
+            network = prt_network.shared() if conn is traci else prt_network.NetworkCache(conn)
+        self.network = network
         for i in self.incomings:
-            if traci.lane.getLength(i+"_0") < self.v2i_range:
-                self.v2i_range = math.floor(traci.lane.getLength(i+"_0"))
+            if self.network.edge_length(i) < self.v2i_range:
+                self.v2i_range = math.floor(self.network.edge_length(i))
                 # print("SZ_Nr.: " + self.id + "... range: " + str(self.v2i_range)) # debugging only
+        self.own_subscriptions = subscriptions is None
+        self.subscriptions = SubscriptionManager(conn) if subscriptions is None else subscriptions
+        self.subscriptions.register(self)
+        self.kpi = None
+        self.corridor = None
+        self.pre_reserved = {}
+
+    @property
+    def served_veh(self):
+        return list(self.handles)
+
+    @property
+    def cars_slots(self):
+        return {vid: float(self.store.data['slot'][handle]) for vid, handle in self.handles.items()}
+
+    @property
+    def cars_v(self):
+        return {vid: float(self.store.data['target_speed'][handle]) for vid, handle in self.handles.items()}
+
+    @property
+    def new_veh(self):
+        data = self.store.data
+        return {vid: [vid, float(data['speed'][handle]), float(data['distance'][handle]),
+                      None if np.isnan(data['desired'][handle]) else float(data['desired'][handle])]
+                for vid, handle in zip(self.new_ids, self.new_handles)}
 
     def check_new_veh(self):
         """
-        checks if new vehicles have arrived in the v2i zone. If yes, they are stored in the new_veh list to be dealt
-        with in another method.
+        checks if new vehicles have arrived in the v2i zone. If yes, they are added to the vehicle store and to the
+        new vehicles of the step to be dealt with in another method.
         :return:
         """
-        self.new_veh = {}
+        self.new_ids = []
+        self.new_handles = []
         for incoming_edge in self.incomings:
-            lastStepVehicleIds = traci.edge.getLastStepVehicleIDs(incoming_edge)
-            new_vehicles = [x for x in lastStepVehicleIds if x not in self.served_veh]
-            for vid in new_vehicles:
-                remainingDist = traci.vehicle.getDrivingDistance(vehID=vid, edgeID=incoming_edge, \
-                                                                 pos=(traci.lane.getLength(incoming_edge + '_0'))) \
+            for vid in self.subscriptions.vehicles_on(incoming_edge):
+                if vid in self.handles:
+                    continue
+                # the vehicle is on the incoming edge, so its driving distance is the rest of the lane
+                remainingDist = self.network.edge_length(incoming_edge) - self.subscriptions.lane_position(vid) \
                                 - self.stopline
                 if remainingDist < self.v2i_range:
-                    self.new_veh[vid] = [vid, traci.vehicle.getSpeed(vid), remainingDist, None]  # ID, Speed, Dist, ETA
-                    self.served_veh.append(vid)
+                    handle = self.store.add(self.subscriptions.speed(vid), remainingDist)
+                    self.handles[vid] = handle
+                    self.new_ids.append(vid)
+                    self.new_handles.append(handle)
         return
 
     def serve_new_veh(self, step, step_multiplier):
         """
         vehicles which have just arrived in the v2i zone are dealt with. Their soonest possible arrival time is calculated
-        as well as the respective speed and acceleration. SpeedMode is changed to 32 and speed set.
+        as well as the respective speed and acceleration. All new vehicles of the step are served together in the order
+        of their desired arrival time, afterwards their speedMode is changed to 32 and speed set in one batch.
         :param step: current simulation step : int
         :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
         :return:
         """
-        # 0ID, 1 Speed, 2 Dist, 3 ETA
-        for vid in self.new_veh:
-            traci.vehicle.setSpeedMode(vid, 32)
-            ETA = None
-            v_current = traci.vehicle.getSpeed(vid)
-            desiredETA = compute_ETA(v_current, self.vmax, self.new_veh[vid][2], self.amax, self.dec_max) * \
-                         step_multiplier + step
-            if len(self.blocked_slots) == 0:
-                self.blocked_slots.append(desiredETA)
-                ETA = desiredETA
-                new_speed = self.vmax
-                traci.vehicle.setSpeed(vid, new_speed)
-            elif len(self.blocked_slots) >= 1:
-                possibleETA = self.blocked_slots[-1] + (self.timegap + (self.vehlen / self.vmax)) * step_multiplier
-                if possibleETA < desiredETA:
-                    self.blocked_slots.append(desiredETA)
-                    ETA = desiredETA
-                    new_speed = self.vmax
-                    traci.vehicle.setSpeed(vid, new_speed)
-                else:
-                    self.blocked_slots.append(possibleETA)
-                    ETA = possibleETA
-                    new_speed = self.new_veh[vid][2] / ((possibleETA - step) / step_multiplier)
-                    traci.vehicle.setSpeed(vid, new_speed)
+        serve_compressors([self], step, step_multiplier)
+        return
+
+    def assign_slots(self, desired_ETAs, step_multiplier):
+        """
+        reserves a slot for each new vehicle, in the order of their desired arrival times
+        :param desired_ETAs: desired arrival times of the new vehicles in simulation steps, in the order of new_ids :
+        numpy array
+        :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
+        :return: reserved slots in simulation steps : numpy array
+        """
+        headway = self.slot_headway(step_multiplier)
+        slots = np.empty(len(desired_ETAs))
+        for i in np.argsort(desired_ETAs, kind='stable'):
+            # earliest slot that keeps the headway to all reservations, gaps between reservations included
+            slots[i] = self.blocked_slots.earliest_slot(float(desired_ETAs[i]), headway)
+            self.blocked_slots.reserve(slots[i])
+        return slots
+
+    def finish_serving(self, desired_ETAs, slots, new_speeds):
+        """
+        records the desired arrivals, slots and speeds of the new vehicles in the store and sends the speed commands
+        :param desired_ETAs: desired arrival times of the new vehicles, in the order of new_handles : numpy array
+        :param slots: reserved slots of the new vehicles : numpy array
+        :param new_speeds: speeds of the new vehicles : numpy array
+        :return:
+        """
+        data = self.store.data
+        data['desired'][self.new_handles] = desired_ETAs
+        data['slot'][self.new_handles] = slots
+        data['target_speed'][self.new_handles] = new_speeds
+        self.send_speed_commands(zip(self.new_ids, np.asarray(new_speeds, dtype=float).tolist()))
+        return
+
+    def send_speed_commands(self, commands):
+        """
+        hands control of the served vehicles over to the compressor (speedMode 32) and sets their speed
+        :param commands: vehicle IDs and their new speeds : list of tuples
+        :return:
+        """
+        for vid, new_speed in commands:
+            self.conn.vehicle.setSpeedMode(vid, 32)
+            self.conn.vehicle.setSpeed(vid, new_speed)
             if new_speed < self.vmax:
-                traci.vehicle.setColor(vid, (0, 55, 255))  # blue
+                self.conn.vehicle.setColor(vid, (0, 55, 255))  # blue
             else:
-                traci.vehicle.setColor(vid, (0, 255, 0))  # green
-            self.cars_v[vid] = new_speed
-            self.cars_slots[vid] = ETA
-            return
+                self.conn.vehicle.setColor(vid, (0, 255, 0))  # green
+        return
 
     def check_served_veh(self):
         """
-        checks if served vehicles have left the intersection. If yes, they are deleted from the lists and their speedMode
-        is set back to 31 (default; the CFM takes over control of the vehicle)
+        checks if served vehicles have left the intersection. If yes, they are deleted from the store and their
+        speedMode is set back to 31 (default; the CFM takes over control of the vehicle)
         :return:
         """
         for outgoing_edge in self.outgoings:
-            lastStepVehicleIds = traci.edge.getLastStepVehicleIDs(outgoing_edge)
-            finished_vehicles = [x for x in lastStepVehicleIds if x in self.served_veh]
-            for vid in finished_vehicles:
+            for vid in self.subscriptions.vehicles_on(outgoing_edge):
+                handle = self.handles.pop(vid, None)
+                if handle is None:
+                    continue
                 # record the vehicle which has arrived at the junction
-                traci.vehicle.setColor(vid, (255, 255, 255))  # red
-                self.served_veh.remove(vid)
-                self.blocked_slots.remove(self.cars_slots[vid])
-                del self.cars_slots[vid]
-                del self.cars_v[vid]
-                # del self.new_veh[vid]
-                traci.vehicle.setSpeed(vid, self.vmax)
-                traci.vehicle.setSpeedMode(vid, 31)
+                self.conn.vehicle.setColor(vid, (255, 255, 255))  # red
+                self.blocked_slots.release(float(self.store.data['slot'][handle]))
+                self.store.remove(handle)
+                # vehicles with slots at the following compressors of their corridor keep their cruise speed
+                exit_speed = self.corridor.exit_speed(vid) if self.corridor is not None else None
+                self.conn.vehicle.setSpeed(vid, self.vmax if exit_speed is None else exit_speed)
+                self.conn.vehicle.setSpeedMode(vid, 31)
         return
 
+    def slot_headway(self, step_multiplier):
+        """
+        :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
+        :return: minimal time between two slots in simulation steps : float
+        """
+        return (self.timegap + (self.vehlen / self.vmax)) * step_multiplier
+
     def clean_blocked_slots(self, step, step_multiplier):
         """
-        sorts the list of blocked time slots and deletes very old slots in case something went wrong
+        deletes very old slots in case something went wrong
         :param step: current simulation step : int
         :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
         :return:
         """
-        self.blocked_slots = sorted(self.blocked_slots)
-        self.blocked_slots = [test for test in self.blocked_slots if test < \
-                              (step * step_multiplier + self.vmax * 20 * self.timegap)]
+        before = step - self.vmax * 20 * self.timegap * step_multiplier
+        self.blocked_slots.expire(before)
+        # pre-reserved vehicles that never showed up
+        for vid in [vid for vid, slot in self.pre_reserved.items() if slot < before]:
+            del self.pre_reserved[vid]
+            if self.corridor is not None:
+                self.corridor.drop(vid)
         return
 
     def execution_step(self, step, step_multiplier):
@@ -197,8 +512,291 @@ class Compressor:
         :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
         :return:
         """
+        if self.own_subscriptions:
+            self.subscriptions.update()
         self.check_new_veh()
         self.check_served_veh()
         self.serve_new_veh(step, step_multiplier)
         self.clean_blocked_slots(step, step_multiplier)
         return
+
+    def get_state(self):
+        """
+        :return: the reserved slots and the served vehicles of the compressor, e.g. for a checkpoint : dictionary
+        """
+        return {'blocked_slots': list(self.blocked_slots), 'served_veh': self.served_veh,
+                'cars_slots': self.cars_slots, 'cars_v': self.cars_v, 'pre_reserved': dict(self.pre_reserved)}
+
+    def set_state(self, state):
+        """
+        restores the reserved slots and the served vehicles returned by get_state
+        :param state: the state : dictionary
+        :return:
+        """
+        self.blocked_slots = SlotTimeline(state['blocked_slots'])
+        for handle in self.handles.values():
+            self.store.remove(handle)
+        self.handles = {}
+        for vid in state['served_veh']:
+            # speed and distance at the entry are not needed any more
+            handle = self.store.add(np.nan, np.nan)
+            data = self.store.data
+            data['slot'][handle] = state['cars_slots'][vid]
+            data['target_speed'][handle] = state['cars_v'][vid]
+            self.handles[vid] = handle
+        self.pre_reserved = dict(state['pre_reserved'])
+        self.new_ids = []
+        self.new_handles = []
+        return
+
+
+def execution_step(compressors, step, step_multiplier):
+    """
+    executes all functionalities of several compressors, serving the new vehicles of all of them in one batch
+    :param compressors: the compressors : list
+    :param step: current simulation step : int
+    :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
+    :return:
+    """
+    for compressor in compressors:
+        if compressor.own_subscriptions:
+            compressor.subscriptions.update()
+        compressor.check_new_veh()
+        compressor.check_served_veh()
+    serve_compressors(compressors, step, step_multiplier)
+    for compressor in compressors:
+        compressor.clean_blocked_slots(step, step_multiplier)
+    return
+
+
+class CorridorScheduler:
+    """
+    a class that schedules the vehicles along their routes through several compressors at once. When a vehicle enters
+    the v2i zone of a compressor, slots are reserved at this and the following compressors on its remaining route
+    (within the horizon) for one common cruise speed: starting at vmax, the speed is lowered until the vehicle arrives
+    at a free slot everywhere. The following compressors serve the vehicle with its pre-reserved slot and the vehicle
+    keeps its cruise speed in between, instead of being slowed down again at each merge. If no common speed is found,
+    the corridor is shortened, down to the earliest free slot at the current compressor like without the scheduler.
+    Attributes:
+        compressors: the compressors of the network : list
+        subscriptions: subscriptions shared by all compressors, with ROUTE_VARS : SubscriptionManager
+        network: cache of the static network geometry : NetworkCache
+        by_incoming: compressor of each incoming edge : dictionary
+        horizon: maximum number of compressors scheduled per vehicle : int
+        max_distance: maximum distance to the last scheduled compressor : float
+        min_speed_share: lowest cruise speed as share of vmax : float
+        max_iterations: maximum number of speed reductions per vehicle : int
+        cruise_speeds: cruise speed of each scheduled vehicle : dictionary
+        pending: number of pre-reserved slots each scheduled vehicle has not used yet : dictionary
+    Methods:
+        corridor
+        cruise_slots
+        serve
+        exit_speed
+        drop
+        execution_step
+        get_state
+        set_state
+    """
+    def __init__(self, compressors, horizon=3, max_distance=1000., min_speed_share=0.8, max_iterations=10):
+        """
+        initializer of the class, connects the compressors to the scheduler
+        :param compressors: the compressors of the network, sharing one SubscriptionManager with ROUTE_VARS : list
+        :param horizon: maximum number of compressors scheduled per vehicle : int
+        :param max_distance: maximum distance to the last scheduled compressor : float
+        :param min_speed_share: lowest cruise speed as share of vmax : float
+        :param max_iterations: maximum number of speed reductions per vehicle : int
+        """
+        self.compressors = compressors
+        self.subscriptions = compressors[0].subscriptions if compressors else None
+        self.network = compressors[0].network if compressors else None
+        self.by_incoming = {}
+        for compressor in compressors:
+            compressor.corridor = self
+            for incoming in compressor.incomings:
+                self.by_incoming[incoming] = compressor
+        self.horizon = horizon
+        self.max_distance = max_distance
+        self.min_speed_share = min_speed_share
+        self.max_iterations = max_iterations
+        self.cruise_speeds = {}
+        self.pending = {}
+
+    def corridor(self, compressor, vid, distance):
+        """
+        finds the compressors on the remaining route of a vehicle that has just entered the v2i zone of a compressor
+        :param compressor: the compressor the vehicle is approaching : Compressor
+        :param vid: ID of the vehicle : String
+        :param distance: distance of the vehicle to the stop line of the compressor : float
+        :return: the compressors, starting with the given one : list, distances to their stop lines : numpy array
+        """
+        compressors = [compressor]
+        distances = [distance]
+        route = self.subscriptions.route(vid)
+        # end of the current edge
+        distance += compressor.stopline
+        for edge in route[self.subscriptions.route_index(vid) + 1:]:
+            if len(compressors) >= self.horizon or distance > self.max_distance:
+                break
+            following = self.by_incoming.get(edge)
+            if following is not None and following not in compressors:
+                compressors.append(following)
+                distances.append(distance + self.network.edge_length(edge) - following.stopline)
+            # the internal lanes of the junctions are neglected
+            distance += self.network.edge_length(edge)
+        return compressors, np.array(distances)
+
+    def cruise_slots(self, compressors, distances, speed, step, step_multiplier):
+        """
+        lowers the cruise speed of a vehicle until it arrives at a free slot at all compressors of its corridor
+        :param compressors: the compressors of the corridor : list
+        :param distances: distances to their stop lines : numpy array
+        :param speed: current speed of the vehicle : float
+        :param step: current simulation step : int
+        :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
+        :return: cruise speed, None if there is none : float, arrival times in simulation steps : numpy array
+        """
+        first = compressors[0]
+        n = len(compressors)
+        headways = np.array([compressor.slot_headway(step_multiplier) for compressor in compressors])
+        speeds = np.full(n, float(speed))
+        accelerations = np.full(n, first.amax)
+        decelerations = np.full(n, first.dec_max)
+        vmax = np.full(n, first.vmax)
+        cruise_speed = first.vmax
+        for _ in range(self.max_iterations):
+            arrivals = compute_ETAs(speeds, np.full(n, cruise_speed), distances, accelerations, decelerations) * \
+                step_multiplier + step
+            slots = np.array([compressor.blocked_slots.earliest_slot(float(arrival), headway)
+                              for compressor, arrival, headway in zip(compressors, arrivals, headways)])
+            late = slots - arrivals > 1e-6
+            if not late.any():
+                return cruise_speed, arrivals
+            # slow down just enough to reach one of the occupied slots at its next free one, then check again
+            required = slot_speeds(speeds, distances, (slots - step) / step_multiplier, accelerations, decelerations,
+                                   vmax)
+            cruise_speed = min(float(required[late].max()), cruise_speed - 1e-3)
+            if cruise_speed < self.min_speed_share * first.vmax:
+                break
+        return None, None
+
+    def serve(self, step, step_multiplier, compressors=None):
+        """
+        serves the new vehicles of the compressors: vehicles with a pre-reserved slot use it and keep their cruise
+        speed, the other ones are scheduled along their corridor in the order of their desired arrival times
+        :param step: current simulation step : int
+        :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
+        :param compressors: the compressors whose new vehicles are served, all of them if None : list
+        :return:
+        """
+        if compressors is None:
+            compressors = self.compressors
+        handles, counts = new_vehicles(compressors)
+        if len(handles) == 0:
+            return
+        approach = [(compressor, vid) for compressor in compressors for vid in compressor.new_ids]
+        data = compressors[0].store.data
+        speeds = data['speed'][handles]
+        distances = data['distance'][handles]
+        vmax = np.repeat([compressor.vmax for compressor in compressors], counts)
+        amax = np.repeat([compressor.amax for compressor in compressors], counts)
+        dec_max = np.repeat([compressor.dec_max for compressor in compressors], counts)
+        desired = compute_ETAs(speeds, vmax, distances, amax, dec_max) * step_multiplier + step
+        slots = np.empty(len(approach))
+        new_speeds = np.empty(len(approach))
+        for i in np.argsort(desired, kind='stable'):
+            compressor, vid = approach[i]
+            if vid in compressor.pre_reserved:
+                slots[i] = compressor.pre_reserved.pop(vid)
+                new_speeds[i] = self.cruise_speeds.get(vid, compressor.vmax)
+                self.pending[vid] = self.pending.get(vid, 1) - 1
+                continue
+            corridor, corridor_distances = self.corridor(compressor, vid, distances[i])
+            cruise_speed, arrivals = self.cruise_slots(corridor, corridor_distances, speeds[i], step, step_multiplier)
+            while cruise_speed is None and len(corridor) > 1:
+                # shorten the corridor until a common cruise speed is found
+                corridor, corridor_distances = corridor[:-1], corridor_distances[:-1]
+                cruise_speed, arrivals = self.cruise_slots(corridor, corridor_distances, speeds[i], step,
+                                                           step_multiplier)
+            if cruise_speed is None:
+                # local fix only, like a compressor on its own
+                slots[i] = compressor.blocked_slots.earliest_slot(float(desired[i]),
+                                                                  compressor.slot_headway(step_multiplier))
+                compressor.blocked_slots.reserve(slots[i])
+                new_speeds[i] = vmax[i] if slots[i] <= desired[i] else \
+                    slot_speeds(speeds[i:i + 1], distances[i:i + 1], (slots[i:i + 1] - step) / step_multiplier,
+                                amax[i:i + 1], dec_max[i:i + 1], vmax[i:i + 1])[0]
+                self.drop(vid)
+                continue
+            for following, arrival in zip(corridor, arrivals):
+                following.blocked_slots.reserve(float(arrival))
+                if following is not compressor:
+                    following.pre_reserved[vid] = float(arrival)
+            slots[i] = arrivals[0]
+            new_speeds[i] = cruise_speed
+            self.cruise_speeds[vid] = cruise_speed
+            self.pending[vid] = len(corridor) - 1
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        for compressor, start, end in zip(compressors, bounds[:-1], bounds[1:]):
+            if end > start:
+                compressor.finish_serving(desired[start:end], slots[start:end], new_speeds[start:end])
+                if compressor.kpi is not None:
+                    compressor.kpi.add_merge_delays(compressor.id,
+                                                    (slots[start:end] - desired[start:end]) / step_multiplier)
+        return
+
+    def exit_speed(self, vid):
+        """
+        :param vid: ID of a vehicle that leaves a compressor : String
+        :return: its cruise speed if it still has pre-reserved slots ahead, None otherwise : float
+        """
+        if self.pending.get(vid, 0) > 0:
+            return self.cruise_speeds[vid]
+        self.drop(vid)
+        return None
+
+    def drop(self, vid):
+        """
+        forgets the cruise speed and pending slots of a vehicle
+        :param vid: ID of the vehicle : String
+        :return:
+        """
+        self.cruise_speeds.pop(vid, None)
+        self.pending.pop(vid, None)
+        return
+
+    def execution_step(self, step, step_multiplier, compressors=None):
+        """
+        executes all functionalities of the compressors, with the new vehicles scheduled along their corridors
+        :param step: current simulation step : int
+        :param step_multiplier: multiplier to calculate back to seconds from the simulation step length
+        :param compressors: the compressors that are executed, e.g. only the awake ones, all of them if None : list
+        :return:
+        """
+        if compressors is None:
+            compressors = self.compressors
+        for compressor in compressors:
+            if compressor.own_subscriptions:
+                compressor.subscriptions.update()
+            compressor.check_new_veh()
+            compressor.check_served_veh()
+        self.serve(step, step_multiplier, compressors)
+        for compressor in compressors:
+            compressor.clean_blocked_slots(step, step_multiplier)
+        return
+
+    def get_state(self):
+        """
+        :return: the cruise speeds and pending slots of the scheduled vehicles, e.g. for a checkpoint : dictionary
+        """
+        return {'cruise_speeds': dict(self.cruise_speeds), 'pending': dict(self.pending)}
+
+    def set_state(self, state):
+        """
+        restores the cruise speeds and pending slots returned by get_state
+        :param state: the state : dictionary
+        :return:
+        """
+        self.cruise_speeds = dict(state['cruise_speeds'])
+        self.pending = dict(state['pending'])
+        return
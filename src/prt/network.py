@@ -0,0 +1,319 @@
+import traci
+import os
+import heapq
+import hashlib
+import numpy as np
+
+_shared_network = None
+
+
+def shared():
+    """
+    returns the network cache shared by all modules. It is created on first use and fills itself lazily via traci.
+    :return: the shared network cache : NetworkCache
+    """
+    global _shared_network
+    if _shared_network is None:
+        _shared_network = NetworkCache()
+    return _shared_network
+
+
+def set_shared(network):
+    """
+    replaces the shared network cache, e.g. by one that was preloaded from the net file
+    :param network: the new shared network cache : NetworkCache
+    :return:
+    """
+    global _shared_network
+    _shared_network = network
+    return
+
+
+class NetworkCache:
+    """
+    a class that caches the static geometry of the network, which does not change during a run. Values that have not
+    been preloaded (from the net file or a batched traci pass) are fetched via traci once on first use.
+    Attributes:
+        conn: connection the values that have not been preloaded are fetched from : traci Connection or libsumo
+        lane_lengths: length of each lane : dictionary
+        edge_lanes: IDs of the lanes of each edge : dictionary
+        parking_lanes: lane of each parking area : dictionary
+        parking_edges: edge of each parking area : dictionary
+        parking_capacities: number of parking spaces of each parking area : dictionary
+        edges: IDs of all edges, None until first use : list
+        prt_edge_ids: IDs of the non-internal PRT edges, None until first use : list
+        parking_area_ids: IDs of all parking areas, None until first use : list
+    Methods:
+        from_net_file
+        from_traci
+        lane_length
+        edge_length
+        lanes
+        edge_ids
+        prt_edges
+        parking_areas
+        parking_area_edge
+        parking_capacity
+    """
+    def __init__(self, conn=traci):
+        """
+        initializer of the class, constructs the (empty) attributes
+        :param conn: connection to the simulation : traci Connection or libsumo
+        """
+        self.conn = conn
+        self.lane_lengths = {}
+        self.edge_lanes = {}
+        self.parking_lanes = {}
+        self.parking_edges = {}
+        self.parking_capacities = {}
+        self.edges = None
+        self.prt_edge_ids = None
+        self.parking_area_ids = None
+
+    @classmethod
+    def from_net_file(cls, net_file, additional_files=()):
+        """
+        preloads the cache from a net file and additional files containing parking areas, without any traci call
+        :param net_file: path to the .net.xml : String
+        :param additional_files: paths to additional files with parking areas : list
+        :return: the preloaded cache : NetworkCache
+        """
+        import sumolib
+        network = cls()
+        net = sumolib.net.readNet(net_file)
+        network.edges = []
+        for edge in net.getEdges():
+            network.edges.append(edge.getID())
+            network.edge_lanes[edge.getID()] = [lane.getID() for lane in edge.getLanes()]
+            for lane in edge.getLanes():
+                network.lane_lengths[lane.getID()] = lane.getLength()
+        network.parking_area_ids = []
+        for additional_file in additional_files:
+            for parking_area in sumolib.xml.parse(additional_file, 'parkingArea'):
+                network.parking_area_ids.append(parking_area.id)
+                network.parking_lanes[parking_area.id] = parking_area.lane
+                network.parking_edges[parking_area.id] = net.getLane(parking_area.lane).getEdge().getID()
+                network.parking_capacities[parking_area.id] = int(parking_area.roadsideCapacity or 0)
+        return network
+
+    @classmethod
+    def from_traci(cls, conn=traci):
+        """
+        preloads the cache in one pass over all lanes and parking areas of the running simulation
+        :param conn: connection to the simulation : traci Connection or libsumo
+        :return: the preloaded cache : NetworkCache
+        """
+        network = cls(conn)
+        network.edges = list(conn.edge.getIDList())
+        for lane in conn.lane.getIDList():
+            network.lane_lengths[lane] = conn.lane.getLength(lane)
+            network.edge_lanes.setdefault(conn.lane.getEdgeID(lane), []).append(lane)
+        network.parking_area_ids = list(conn.parkingarea.getIDList())
+        for parking_area in network.parking_area_ids:
+            network.parking_lanes[parking_area] = conn.parkingarea.getLaneID(parking_area)
+            network.parking_edges[parking_area] = conn.lane.getEdgeID(network.parking_lanes[parking_area])
+        return network
+
+    def lane_length(self, lane_id):
+        """
+        :param lane_id: ID of the lane : String
+        :return: length of the lane : float
+        """
+        if lane_id not in self.lane_lengths:
+            self.lane_lengths[lane_id] = self.conn.lane.getLength(lane_id)
+        return self.lane_lengths[lane_id]
+
+    def edge_length(self, edge_id):
+        """
+        :param edge_id: ID of the edge : String
+        :return: length of the edge, i.e. of its first lane : float
+        """
+        return self.lane_length(edge_id + '_0')
+
+    def lanes(self, edge_id):
+        """
+        :param edge_id: ID of the edge : String
+        :return: IDs of the lanes of the edge : list
+        """
+        if edge_id not in self.edge_lanes:
+            self.edge_lanes[edge_id] = ["%s_%s" % (edge_id, i) for i in range(self.conn.edge.getLaneNumber(edge_id))]
+        return self.edge_lanes[edge_id]
+
+    def edge_ids(self):
+        """
+        :return: IDs of all edges of the network : list
+        """
+        if self.edges is None:
+            self.edges = list(self.conn.edge.getIDList())
+        return self.edges
+
+    def prt_edges(self):
+        """
+        :return: IDs of the non-internal edges of the PRT network : list
+        """
+        if self.prt_edge_ids is None:
+            self.prt_edge_ids = [e for e in self.edge_ids() if "gne" in e and ":" not in e]
+        return self.prt_edge_ids
+
+    def parking_areas(self):
+        """
+        :return: IDs of all parking areas : list
+        """
+        if self.parking_area_ids is None:
+            self.parking_area_ids = list(self.conn.parkingarea.getIDList())
+        return self.parking_area_ids
+
+    def parking_area_edge(self, parking_area_id):
+        """
+        :param parking_area_id: ID of the parking area : String
+        :return: ID of the edge the parking area is located on : String
+        """
+        if parking_area_id not in self.parking_edges:
+            if parking_area_id not in self.parking_lanes:
+                self.parking_lanes[parking_area_id] = self.conn.parkingarea.getLaneID(parking_area_id)
+            self.parking_edges[parking_area_id] = self.conn.lane.getEdgeID(self.parking_lanes[parking_area_id])
+        return self.parking_edges[parking_area_id]
+
+    def parking_capacity(self, parking_area_id):
+        """
+        :param parking_area_id: ID of the parking area : String
+        :return: number of parking spaces of the parking area : int
+        """
+        if parking_area_id not in self.parking_capacities:
+            self.parking_capacities[parking_area_id] = int(self.conn.simulation.getParameter(parking_area_id,
+                                                                                           "parkingArea.capacity"))
+        return self.parking_capacities[parking_area_id]
+
+
+class DistanceTable:
+    """
+    a class that holds the shortest driving distances between all edges of a (small, static) network, e.g. the PRT
+    guideway. It is computed once with Dijkstra and cached on disk, keyed by the hash of the net file, so distance queries
+    during the simulation are lookups.
+    Attributes:
+        edge_ids: IDs of the non-internal edges : list
+        index: row/column of each edge in the matrix : dictionary
+        lengths: length of each edge : numpy array
+        matrix: distance from the end of the row edge to the start of the column edge : numpy array
+    Methods:
+        from_net_file
+        compute
+        edge_to_edge
+        from_position
+        from_positions
+    """
+    def __init__(self, edge_ids, lengths, matrix):
+        """
+        initializer of the class
+        :param edge_ids: IDs of the non-internal edges : list
+        :param lengths: length of each edge : numpy array
+        :param matrix: distance from the end of the row edge to the start of the column edge, inf if unreachable :
+        numpy array
+        """
+        self.edge_ids = list(edge_ids)
+        self.index = {edge: i for i, edge in enumerate(self.edge_ids)}
+        self.lengths = np.asarray(lengths, dtype=float)
+        self.matrix = np.asarray(matrix, dtype=float)
+
+    @classmethod
+    def from_net_file(cls, net_file, cache_dir=None):
+        """
+        loads the distance table of a net file from the disk cache or computes and caches it
+        :param net_file: path to the .net.xml : String
+        :param cache_dir: directory of the cache files, the directory of the net file if None : String
+        :return: the distance table : DistanceTable
+        """
+        with open(net_file, 'rb') as f:
+            net_hash = hashlib.sha1(f.read()).hexdigest()[:16]
+        if cache_dir is None:
+            cache_dir = os.path.dirname(os.path.abspath(net_file))
+        cache_file = os.path.join(cache_dir, "%s.%s.dist.npz" % (os.path.basename(net_file), net_hash))
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as cached:
+                return cls(list(cached['edge_ids']), cached['lengths'], cached['matrix'])
+        table = cls.compute(net_file)
+        # written to a file of this process first, so parallel runs with a cold cache never read a half-written file
+        tmp = "%s.%s.tmp" % (cache_file, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.savez(f, edge_ids=np.array(table.edge_ids), lengths=table.lengths, matrix=table.matrix)
+        os.replace(tmp, cache_file)
+        return table
+
+    @classmethod
+    def compute(cls, net_file):
+        """
+        computes the distances between all non-internal edges of a net file with one Dijkstra run per edge. The lengths
+        of the internal lanes of the junctions are included.
+        :param net_file: path to the .net.xml : String
+        :return: the distance table : DistanceTable
+        """
+        import sumolib
+        net = sumolib.net.readNet(net_file, withInternal=True)
+        edges = [edge for edge in net.getEdges() if edge.getFunction() != "internal"]
+        edge_ids = [edge.getID() for edge in edges]
+        index = {edge: i for i, edge in enumerate(edge_ids)}
+        lengths = np.array([edge.getLength() for edge in edges])
+        # successors of each edge with the distance from its end to the end of the successor
+        successors = []
+        for edge in edges:
+            arcs = {}
+            for to_edge, connections in edge.getOutgoing().items():
+                if to_edge.getID() not in index:
+                    continue
+                via = min([net.getLane(c.getViaLaneID()).getLength() if c.getViaLaneID() else 0.
+                           for c in connections])
+                arcs[index[to_edge.getID()]] = via + to_edge.getLength()
+            successors.append(arcs)
+        matrix = np.full((len(edges), len(edges)), np.inf)
+        for source in range(len(edges)):
+            # distances from the end of the source to the end of each edge; the source itself is only reached by a loop
+            dist_end = np.full(len(edges), np.inf)
+            heap = [(cost, target) for target, cost in successors[source].items()]
+            heapq.heapify(heap)
+            while heap:
+                cost, target = heapq.heappop(heap)
+                if cost >= dist_end[target]:
+                    continue
+                dist_end[target] = cost
+                for successor, arc in successors[target].items():
+                    if cost + arc < dist_end[successor]:
+                        heapq.heappush(heap, (cost + arc, successor))
+            matrix[source] = dist_end - lengths
+        return cls(edge_ids, lengths, matrix)
+
+    def edge_to_edge(self, from_edge, to_edge):
+        """
+        :param from_edge: ID of the start edge : String
+        :param to_edge: ID of the target edge : String
+        :return: driving distance from the end of the start edge to the start of the target edge, inf if unknown : float
+        """
+        if from_edge not in self.index or to_edge not in self.index:
+            return float("inf")
+        return float(self.matrix[self.index[from_edge], self.index[to_edge]])
+
+    def from_position(self, edge, pos, to_edge):
+        """
+        :param edge: ID of the edge the vehicle is on : String
+        :param pos: position of the vehicle on the edge : float
+        :param to_edge: ID of the target edge : String
+        :return: driving distance from the position to the start of the target edge, inf if unknown : float
+        """
+        if edge not in self.index:
+            return float("inf")
+        return float(self.lengths[self.index[edge]]) - pos + self.edge_to_edge(edge, to_edge)
+
+    def from_positions(self, edges, positions, to_edges):
+        """
+        vectorized version of from_position for many vehicles and targets
+        :param edges: IDs of the edges the vehicles are on : list
+        :param positions: positions of the vehicles on their edges : list
+        :param to_edges: IDs of the target edges : list
+        :return: driving distances from each position to the start of each target edge, inf if unknown : numpy array
+        """
+        rows = np.array([self.index.get(edge, -1) for edge in edges], dtype=int)
+        cols = np.array([self.index.get(edge, -1) for edge in to_edges], dtype=int)
+        dist = (self.lengths[rows] - np.asarray(positions, dtype=float))[:, np.newaxis] + \
+            self.matrix[rows[:, np.newaxis], cols[np.newaxis, :]]
+        dist[rows < 0, :] = np.inf
+        dist[:, cols < 0] = np.inf
+        return dist
@@ -1,210 +1,362 @@
 import traci
 import random
+import time
+import numpy as np
+from prt import network as prt_network
+from prt.assignment import solve_assignment
+from prt.fleet import FleetTracker, IDLE, PARKED
+from prt.connection import TRACI_ERRORS
 
-rebalanced_veh = {'Station': [], 'Hotel': [], 'Hospital': [], 'depot': []}  # needed for reb. method "park_closest"
-nr_at_station = {'Station': 0, 'Hotel': 0, 'Hospital': 0, 'depot': 0}  # needed for reb. method "park_closest"
+default_fleet = FleetTracker()  # used if rebalance/dispatch are called without a fleet tracker
 
 
-def dist_to_edge(vehId, edgeId):
+def dist_to_edge(vehId, edgeId, distances=None, conn=traci):
+    """
+    computes the driving distance of a vehicle to an edge
+    :param vehId: ID of the vehicle : String
+    :param edgeId: ID of the target edge : String
+    :param distances: precomputed distances of the PRT network. If given, the distance is looked up from the current
+    edge and position of the vehicle; vehicles on internal lanes are routed via traci : DistanceTable
+    :param conn: connection to the simulation : traci Connection or libsumo
+    :return: driving distance to the start of the edge, inf if no route is found : Float
+    """
+    if distances is not None:
+        road_id = conn.vehicle.getRoadID(vehId)
+        if road_id in distances.index:
+            return distances.from_position(road_id, conn.vehicle.getLanePosition(vehId), edgeId)
+    dist = float("inf")  # in case no route is found
     try:
-        start_edge = traci.vehicle.getLaneID(vehId)
+        start_edge = conn.vehicle.getLaneID(vehId)
         start_edge = start_edge[:len(start_edge)-2]
         if start_edge != '':
-            stage = traci.simulation.findRoute(fromEdge=start_edge, toEdge=edgeId, vType=traci.vehicle.getTypeID(vehId))
+            stage = conn.simulation.findRoute(fromEdge=start_edge, toEdge=edgeId, vType=conn.vehicle.getTypeID(vehId))
             dist = stage.length
         else:
-            tmp_target = traci.vehicle.getRoute(vehId)[-1]  # save the current target to reset later
+            tmp_target = conn.vehicle.getRoute(vehId)[-1]  # save the current target to reset later
             try:  # changing target can cause problems and cause traci to crash
-                traci.vehicle.changeTarget(vehID=vehId, edgeID=edgeId)
-                dist = traci.vehicle.getDrivingDistance(vehID=vehId, edgeID=edgeId, pos=0)
-                traci.vehicle.changeTarget(vehID=vehId, edgeID=tmp_target)
-            except traci.exceptions.TraCIException as e:
+                conn.vehicle.changeTarget(vehID=vehId, edgeID=edgeId)
+                dist = conn.vehicle.getDrivingDistance(vehID=vehId, edgeID=edgeId, pos=0)
+                conn.vehicle.changeTarget(vehID=vehId, edgeID=tmp_target)
+            except TRACI_ERRORS as e:
                 # do something with the exception here if desired
                 pass
 
-    except traci.exceptions.TraCIException as e:
+    except TRACI_ERRORS as e:
         # parked vehicles might return an empty stage object (= no dist). in that case, try the "old" way.
         # print(e)
-        tmp_target = traci.vehicle.getRoute(vehId)[-1]  # save the current target to reset later
+        tmp_target = conn.vehicle.getRoute(vehId)[-1]  # save the current target to reset later
         try:  # changing target can cause problems and cause traci to crash
-            traci.vehicle.changeTarget(vehID=vehId, edgeID=edgeId)
-            dist = traci.vehicle.getDrivingDistance(vehID=vehId, edgeID=edgeId, pos=0)
-            traci.vehicle.changeTarget(vehID=vehId, edgeID=tmp_target)
-        except traci.exceptions.TraCIException as e:
+            conn.vehicle.changeTarget(vehID=vehId, edgeID=edgeId)
+            dist = conn.vehicle.getDrivingDistance(vehID=vehId, edgeID=edgeId, pos=0)
+            conn.vehicle.changeTarget(vehID=vehId, edgeID=tmp_target)
+        except TRACI_ERRORS as e:
             # do something with the exception here if desired
             pass
     return dist
 
 
+def distance_matrix(veh_ids, edge_ids, distances, conn=traci, deadline=None, clock=time.perf_counter):
+    """
+    computes the driving distances of several vehicles to several edges. Vehicles on the PRT network are looked up in
+    the distance table in one go, all others are routed via traci.
+    :param veh_ids: IDs of the vehicles : list
+    :param edge_ids: IDs of the target edges : list
+    :param distances: precomputed distances of the PRT network : DistanceTable
+    :param conn: connection to the simulation : traci Connection or libsumo
+    :param deadline: reading of the clock after which no more routes are computed via traci, the distances that were
+    not routed stay inf. None routes all : float
+    :param clock: wall clock the deadline refers to : function
+    :return: driving distances, one row per vehicle and one column per edge : numpy array
+    """
+    road_ids = [conn.vehicle.getRoadID(veh) for veh in veh_ids]
+    positions = [conn.vehicle.getLanePosition(veh) if road_id in distances.index else 0.
+                 for veh, road_id in zip(veh_ids, road_ids)]
+    dist = distances.from_positions(road_ids, positions, edge_ids)
+    for row, (veh, road_id) in enumerate(zip(veh_ids, road_ids)):
+        if road_id not in distances.index:
+            for col, edge in enumerate(edge_ids):
+                if deadline is not None and clock() > deadline:
+                    dist[row, col] = float("inf")
+                else:
+                    dist[row, col] = dist_to_edge(veh, edge, conn=conn)
+    return dist
+
+
+def prt_stops(distances, network=None):
+    """
+    discovers the PRT stations, i.e. the parking areas on the PRT network except for the depot
+    :param distances: precomputed distances of the PRT network : DistanceTable
+    :param network: cache of the static network geometry, the shared one if None : NetworkCache
+    :return: IDs of the stations : list
+    """
+    if network is None:
+        network = prt_network.shared()
+    return [stop for stop in network.parking_areas() if 'depot' not in stop and
+            network.parking_area_edge(stop) in distances.index]
+
+
+def nr_at_station(stops, fleet):
+    """
+    calculates the total number of parked AND assigned vehicles for each stop
+    :param stops: IDs of the stops (parking areas) : list
+    :param fleet: the updated fleet state : FleetTracker
+    :return: number of vehicles for each stop : dictionary
+    """
+    return {stop: fleet.conn.parkingarea.getVehicleCount(stop) + len(fleet.en_route_to(stop)) for stop in stops}
+
+
+def send_to_park(veh, stop, fleet):
+    """
+    sends an empty vehicle to a parking area, where it parks until it is booked
+    :param veh: ID of the vehicle : String
+    :param stop: ID of the parking area : String
+    :param fleet: the fleet state : FleetTracker
+    :return: True if the vehicle was sent : bool
+    """
+    try:
+        if fleet.state.get(veh) == PARKED:
+            fleet.conn.vehicle.resume(veh)  # ends the parking stop at its current station
+        fleet.conn.vehicle.changeTarget(vehID=veh, edgeID=fleet.network.parking_area_edge(stop))
+        fleet.conn.vehicle.setParkingAreaStop(vehID=veh, stopID=stop, duration=999999, flags=1)
+    except TRACI_ERRORS:
+        return False
+    fleet.send_to_park(veh, stop)
+    return True
+
+
+def park_closest(max_occ, distances, idling, fleet):
+    """
+    sends each new idle vehicle to the closest station that is not completely occupied, one after the other
+    :param max_occ: maximum occupancy at which vehicles still wait at the station
+    :param distances: precomputed distances of the PRT network : DistanceTable
+    :param idling: if True, vehicles that do not find a space idle randomly, otherwise they park in the depot
+    :param fleet: the updated fleet state : FleetTracker
+    :return:
+    """
+    max_occ = 5 * max_occ
+    prt_stops = ['Hotel', 'Station', 'Hospital']
+    occupancy = nr_at_station(prt_stops, fleet)
+    # look for the closest parking spot for each vehicle that is new in idle
+    for veh in fleet.vehicles(IDLE):
+        found_parking = 0  # the vehicle has not found a slot in one of the stations
+        min_dist = float("inf")  # set the minimal distance to inf for each vehicle
+        for stop in prt_stops:  # check the distance to the stop
+            dist_to_stop = dist_to_edge(veh, stop, distances, fleet.conn)
+            if 0 < dist_to_stop < min_dist:
+                if occupancy[stop] < max_occ:
+                    found_parking = 1
+                    min_dist = dist_to_stop
+                    new_destination = stop
+        if found_parking > 0:
+            if send_to_park(veh, new_destination, fleet):
+                occupancy[new_destination] += 1
+        elif not idling:  # if no space was available in any station, go to depot
+            send_to_park(veh, 'depot', fleet)
+    return
+
+
+def park_optimal(max_occ, distances, idling, fleet):
+    """
+    assigns all new idle vehicles at once to the free parking spaces of the PRT stations, so that the total driving
+    distance is minimal (capacity constrained min-cost assignment).
+    :param max_occ: share of the parking spaces of a station that may be occupied : Float
+    :param distances: precomputed distances of the PRT network : DistanceTable
+    :param idling: if True, vehicles that do not get a parking space idle randomly, otherwise they park in the depot
+    :param fleet: the updated fleet state : FleetTracker
+    :return:
+    """
+    new_idle_veh = fleet.vehicles(IDLE)
+    if len(new_idle_veh) == 0:
+        return
+    network = fleet.network
+    stops = prt_stops(distances, network)
+    occupancy = nr_at_station(stops, fleet)
+    # one column per free parking space, but never more spaces per stop than vehicles
+    free_spaces = [min(len(new_idle_veh), max(0, int(max_occ * network.parking_capacity(stop)) - occupancy[stop]))
+                   for stop in stops]
+    space_stops = np.repeat(np.arange(len(stops)), free_spaces)
+    dist = distance_matrix(new_idle_veh, [network.parking_area_edge(stop) for stop in stops], distances, fleet.conn)
+    dist[~(dist > 0)] = np.inf
+    rows, cols = solve_assignment(dist[:, space_stops])
+    for row, col in zip(rows, cols):
+        send_to_park(new_idle_veh[row], stops[space_stops[col]], fleet)
+    if not idling:
+        # if no space was available in any station, go to depot
+        for veh in fleet.vehicles(IDLE):
+            send_to_park(veh, 'depot', fleet)
+    return
+
+
+def park_anticipatory(max_occ, distances, fleet, forecast, sim_time, horizon=900.):
+    """
+    sends empty vehicles to the stations where the forecast expects more pickups within the horizon than vehicles
+    are parked there or on their way to it. Stations with more vehicles than expected pickups give their surplus
+    parked vehicles away. The surplus and the new idle vehicles are assigned to the missing vehicles of all stations at
+    once with minimal total distance (transport problem). Idle vehicles that are not needed anywhere park like with
+    park_optimal.
+    :param max_occ: share of the parking spaces of a station that may be occupied : Float
+    :param distances: precomputed distances of the PRT network : DistanceTable
+    :param fleet: the updated fleet state : FleetTracker
+    :param forecast: forecast of the pickups at the stations : DemandForecast
+    :param sim_time: current simulation time in seconds : Float
+    :param horizon: length of the forecast window in seconds : Float
+    :return:
+    """
+    network = fleet.network
+    stops = prt_stops(distances, network)
+    occupancy = nr_at_station(stops, fleet)
+    supply = np.array([occupancy[stop] for stop in stops])
+    demand = np.ceil(forecast.expected(sim_time, horizon, stops) - 1e-9)
+    free_spaces = np.array([int(max_occ * network.parking_capacity(stop)) for stop in stops]) - supply
+    # the parked vehicles are only known by station if they were sent there
+    parked = {}
+    for veh in fleet.vehicles(PARKED):
+        if veh in fleet.target:
+            parked.setdefault(fleet.target[veh], []).append(veh)
+    vehicles = fleet.vehicles(IDLE)
+    for stop, surplus in zip(stops, supply - demand):
+        if surplus >= 1:
+            vehicles += parked.get(stop, [])[:int(surplus)]
+    deficit = np.clip(np.minimum(demand - supply, free_spaces), 0, len(vehicles)).astype(int)
+    if len(vehicles) > 0 and deficit.sum() > 0:
+        # one column per missing vehicle
+        missing_stops = np.repeat(np.arange(len(stops)), deficit)
+        dist = distance_matrix(vehicles, [network.parking_area_edge(stops[i]) for i in np.flatnonzero(deficit)],
+                               distances, fleet.conn)
+        dist[~(dist > 0)] = np.inf
+        deficit_col = np.cumsum(deficit > 0) - 1
+        rows, cols = solve_assignment(dist[:, deficit_col[missing_stops]])
+        for row, col in zip(rows, cols):
+            send_to_park(vehicles[row], stops[missing_stops[col]], fleet)
+    park_optimal(max_occ, distances, idling=True, fleet=fleet)
+    return
 
-def rebalance(method, max_occ=1):
+
+def rebalance(method, max_occ=1, distances=None, fleet=None, forecast=None, sim_time=None, horizon=900.):
     """
     Rebalances empty vehicles to bus stops according to a specified method
     :param method: Name of the Method/Algorithm/Heuristic according to which the vehicles should be redistributed : String
     :param max_occ: maximum occupancy at which vehicles still wait at the station
+    :param distances: precomputed distances of the PRT network, used by the "park_closest" and "park_optimal" methods,
+    which require it : DistanceTable
+    :param fleet: fleet state that was updated in the current step. If None, the default fleet state is updated and
+    used : FleetTracker
+    :param forecast: forecast of the pickups at the stations, required by the "anticipatory" method : DemandForecast
+    :param sim_time: current simulation time in seconds, used by the "anticipatory" method, queried if None : Float
+    :param horizon: length of the forecast window of the "anticipatory" method in seconds : Float
     :return: None (if no method is specified, the vehicles will drive random routes when they are not assigned to a customer)
     """
-    global rebalanced_veh
-    global nr_at_station
-
     if method == 'random_idling':
         # the taxis idle randomly on their own via the SUMO functionality
         return
 
-    elif method == 'park_in_depot':  # TODO: only works for one hard coded depot right now
+    if fleet is None:
+        fleet = default_fleet
+        fleet.update()
+
+    if method == 'park_in_depot':  # TODO: only works for one hard coded depot right now
         # unoccupied vehicles fo back to the depot
-        fleet = traci.vehicle.getTaxiFleet(0)
-        stops = traci.parkingarea.getIDList()
-        depot = [stop for stop in stops if 'depot' in stop]
-        for taxi in fleet:
-            if not traci.vehicle.isStoppedParking(taxi):
-                try:
-                    traci.vehicle.changeTarget(taxi, traci.lane.getEdgeID(traci.parkingarea.getLaneID('depot')))
-                    traci.vehicle.setParkingAreaStop(taxi, 'depot', duration=999999, flags=1)
-                except traci.exceptions.TraCIException as e:
-                    print(e)
-                    continue
+        for taxi in fleet.vehicles(IDLE):
+            send_to_park(taxi, 'depot', fleet)
 
     elif method == 'park_closest_no_idling':
         # vehicles park in the closest station that is not completely occupied.
         # if they don't find a space, they park in the depot.
-        new_idle_veh = []
-        max_occ = 5 * max_occ
-        prt_stops = ['Hotel', 'Station', 'Hospital']
-        # get new idling vehicles
-        fleet = traci.vehicle.getTaxiFleet(0)
-        veh_ids_sum = []
-        for veh_ids in rebalanced_veh.values():
-            veh_ids_sum += veh_ids
-        veh_ids_sum = list(set(veh_ids_sum))
-        for v in fleet:
-            if not traci.vehicle.isStoppedParking(v):
-                if v not in new_idle_veh:
-                    if v not in veh_ids_sum:
-                        new_idle_veh.append(v)
-        # check if vehicles stopped idling/got booked/left the station...
-        for waiting_vehs in rebalanced_veh.values():
-            for veh in waiting_vehs:
-                try:
-                    if traci.vehicle.isStoppedParking(veh):
-                        waiting_vehs.remove(veh)
-                    if veh in traci.vehicle.getTaxiFleet(1):
-                        waiting_vehs.remove(veh)
-                except traci.exceptions.TraCIException as e:
-                    if 'is not known' in str(e):
-                        waiting_vehs.remove(veh)
-                    pass
-        # calculate total numer of parked AND assigned vehicles for each stop:
-        for stop in prt_stops:
-            nr_at_station[stop] = traci.parkingarea.getVehicleCount(stop) + len(rebalanced_veh[stop])
-        nr_at_station['depot'] = traci.parkingarea.getVehicleCount('depot') + len(rebalanced_veh['depot'])
-
-        # look for the closest parking spot for each vehicle that is new in idle
-        for veh in new_idle_veh:
-            found_parking = 0  # the vehicle has not found a slot in one of the stations
-            min_dist = float("inf")  # set the minimal distance to inf for each vehicle
-            for stop in prt_stops:  # check the distance to the stop
-                dist_to_stop = dist_to_edge(veh, stop)
-                if 0 < dist_to_stop < min_dist:
-                    if nr_at_station[stop] < max_occ:
-                        found_parking = 1
-                        min_dist = dist_to_stop
-                        new_destination = stop
-                        # TODO: Evaluate this inside assignment loop
-
-            if found_parking > 0:
-                try:
-                    rebalanced_veh[new_destination].append(veh)
-                    traci.vehicle.changeTarget(vehID=veh, edgeID=new_destination)
-                    traci.vehicle.setParkingAreaStop(vehID=veh, stopID=new_destination, duration=999999, flags=1)
-                    # update total numer of parked AND assigned vehicles for each stop:
-                    nr_at_station[new_destination] = traci.parkingarea.getVehicleCount(stop) + len(rebalanced_veh[new_destination])
-                    nr_at_station['depot'] = traci.parkingarea.getVehicleCount('depot') + len(rebalanced_veh['depot'])
-                except traci.exceptions.TraCIException or traci.exceptions.FatalTraCIError:
-                    pass
-            else:  # if no space was available in any station, go to depot
-                try:
-                    rebalanced_veh['depot'].append(veh)
-                    traci.vehicle.changeTarget(veh, 'Depot')
-                    traci.vehicle.setParkingAreaStop(veh, 'depot', duration=999999, flags=1)
-                except traci.exceptions.TraCIException:
-                    pass
+        park_closest(max_occ, distances, idling=False, fleet=fleet)
 
     elif method == 'park_closest_idling':
         # vehicles park in the closest station that is not completely occupied.
         # if they don't find a space, they idle randomly.
-        new_idle_veh = []
-        max_occ = 5 * max_occ
-        prt_stops = ['Hotel', 'Station', 'Hospital']
-
-        # get new idling vehicles
-        fleet = traci.vehicle.getTaxiFleet(0)
-        veh_ids_sum = []
-        for veh_ids in rebalanced_veh.values():
-            veh_ids_sum += veh_ids
-        veh_ids_sum = list(set(veh_ids_sum))
-        for v in fleet:
-            if not traci.vehicle.isStoppedParking(v):
-                if v not in new_idle_veh:
-                    if v not in veh_ids_sum:
-                        new_idle_veh.append(v)
-        # check if vehicles stopped idling/got booked/left the station...
-        for waiting_vehs in rebalanced_veh.values():
-            for veh in waiting_vehs:
-                try:
-                    if traci.vehicle.isStoppedParking(veh):
-                        waiting_vehs.remove(veh)
-                    if veh in traci.vehicle.getTaxiFleet(1):
-                        waiting_vehs.remove(veh)
-                    if veh in traci.vehicle.getTaxiFleet(2):
-                        waiting_vehs.remove(veh)
-                except traci.exceptions.TraCIException as e:
-                    if 'is not known' in str(e):
-                        waiting_vehs.remove(veh)
-                    pass
-
-        # calculate total numer of parked AND assigned vehicles for each stop:
-        for stop in prt_stops:
-            nr_at_station[stop] = traci.parkingarea.getVehicleCount(stop) + len(rebalanced_veh[stop])
-        nr_at_station['depot'] = traci.parkingarea.getVehicleCount('depot') + len(rebalanced_veh['depot'])
-
-        # look for the closest parking spot for each vehicle that is new in idle
-        for veh in new_idle_veh:
-            found_parking = 0  # the vehicle has not found a slot in one of the stations
-            min_dist = float("inf")  # set the minimal distance to inf for each vehicle
-            for stop in prt_stops:  # check the distance to the stop
-                dist_to_stop = dist_to_edge(veh, stop)
-                if 0 < dist_to_stop < min_dist:
-                    if nr_at_station[stop] < max_occ:
-                        found_parking = 1
-                        min_dist = dist_to_stop
-                        new_destination = stop
-                        # TODO: Evaluate this inside assignment loop
-
-            if found_parking > 0:
-                try:
-                    rebalanced_veh[new_destination].append(veh)
-                    traci.vehicle.changeTarget(vehID=veh, edgeID=new_destination)
-                    traci.vehicle.setParkingAreaStop(vehID=veh, stopID=new_destination, duration=999999, flags=1)
-                    # update total numer of parked AND assigned vehicles for each stop:
-                    nr_at_station[new_destination] = traci.parkingarea.getVehicleCount(stop) + len(rebalanced_veh[new_destination])
-                    nr_at_station['depot'] = traci.parkingarea.getVehicleCount('depot') + len(rebalanced_veh['depot'])
-                except traci.exceptions.TraCIException or traci.exceptions.FatalTraCIError:
-                    pass
-
-
-def dispatch(strategy):
+        park_closest(max_occ, distances, idling=True, fleet=fleet)
+
+    elif method == 'park_optimal_no_idling':
+        # like "park_closest_no_idling", but all new idle vehicles are assigned at once with minimal total distance.
+        # stations are discovered from the parking areas on the PRT network
+        park_optimal(max_occ, distances, idling=False, fleet=fleet)
+
+    elif method == 'park_optimal_idling':
+        # like "park_closest_idling", but all new idle vehicles are assigned at once with minimal total distance
+        park_optimal(max_occ, distances, idling=True, fleet=fleet)
+
+    elif method == 'anticipatory':
+        # vehicles are moved ahead of the demand to the stations that are expected to run short of vehicles within the
+        # horizon, the others park like with "park_optimal_idling"
+        if sim_time is None:
+            sim_time = fleet.conn.simulation.getTime()
+        park_anticipatory(max_occ, distances, fleet, forecast, sim_time, horizon)
+
+
+def dispatch(strategy, distances=None, time_budget=0.05, fleet=None, clock=time.perf_counter):
     """
     dispatches a taxi to new requests. Multiple strategies can be implemented.
     :param strategy: dispatching method to be chosen : String
-    :return:
+    :param distances: precomputed distances of the PRT network, required by the "optimal" strategy : DistanceTable
+    :param time_budget: maximum wall time of a dispatch call in seconds, used by the "optimal" strategy : Float
+    :param fleet: fleet state that was updated in the current step. If None, the default fleet state is updated and
+    used : FleetTracker
+    :param clock: wall clock of the time budget, e.g. the recorded one when replaying : function
+    :return: True if reservations were left for the next call although taxis were free : bool
     """
-    free_taxis = traci.vehicle.getTaxiFleet(flag=0)
-    reservations = traci.person.getTaxiReservations(1)
+    if fleet is None:
+        fleet = default_fleet
+        fleet.update()
     if strategy == "mockup":
+        free_taxis = fleet.empty()
+        # new and already retrieved, but not yet assigned reservations
+        reservations = fleet.conn.person.getTaxiReservations(3)
         for reservation in reservations:
             try:
-                traci.vehicle.dispatchTaxi(random.choice(free_taxis), reservation.id)
-            except traci.exceptions.TraCIException:
+                taxi = random.choice(free_taxis)
+                fleet.conn.vehicle.dispatchTaxi(taxi, reservation.id)
+                fleet.mark_dispatched(taxi)
+            except TRACI_ERRORS + (IndexError,):
                 pass
-    return
+    elif strategy == "optimal":
+        return dispatch_optimal(distances, fleet, time_budget, clock=clock)
+    return False
+
+
+def dispatch_optimal(distances, fleet, time_budget=0.05, batch_size=50, clock=time.perf_counter):
+    """
+    assigns free taxis to open reservations so that the total driving distance to the pickups is minimal. The cost
+    matrix (taxis x reservations) is built from the distance table and solved as an assignment problem, in batches of
+    the oldest reservations. Taxis off the PRT network are routed via traci only while the time budget lasts, the
+    ones that are not routed in time are left for the next call. Once the time budget is used up, the remaining
+    reservations wait for the next call as well. The first batch is always assigned, so every call makes progress.
+    :param distances: precomputed distances of the PRT network : DistanceTable
+    :param fleet: the updated fleet state : FleetTracker
+    :param time_budget: maximum wall time of the call in seconds (exceeded by at most one route and one batch) : Float
+    :param batch_size: number of reservations per assignment problem : int
+    :param clock: wall clock of the time budget, e.g. the recorded one when replaying : function
+    :return: True if the time budget ran out before all reservations and taxis were considered : bool
+    """
+    start = clock()
+    free_taxis = fleet.empty()
+    # new and already retrieved, but not yet assigned reservations
+    reservations = sorted(fleet.conn.person.getTaxiReservations(3), key=lambda r: r.reservationTime)
+    if len(free_taxis) == 0 or len(reservations) == 0:
+        return False
+    pickup_edges = list(dict.fromkeys(r.fromEdge for r in reservations))
+    pickup_dist = distance_matrix(free_taxis, pickup_edges, distances, fleet.conn, start + time_budget, clock)
+    # some taxis may not have been routed in time
+    routing_cut = clock() - start > time_budget
+    pickup_col = {edge: col for col, edge in enumerate(pickup_edges)}
+    available = np.ones(len(free_taxis), dtype=bool)
+    for first in range(0, len(reservations), batch_size):
+        if not available.any():
+            break
+        if first > 0 and clock() - start > time_budget:
+            return True
+        batch = reservations[first:first + batch_size]
+        taxi_rows = np.flatnonzero(available)
+        cost = pickup_dist[np.ix_(taxi_rows, [pickup_col[r.fromEdge] for r in batch])] + \
+            np.array([r.departPos for r in batch])
+        rows, cols = solve_assignment(cost)
+        for row, col in zip(rows, cols):
+            try:
+                fleet.conn.vehicle.dispatchTaxi(free_taxis[taxi_rows[row]], [batch[col].id])
+                available[taxi_rows[row]] = False
+                fleet.mark_dispatched(free_taxis[taxi_rows[row]])
+            except TRACI_ERRORS:
+                pass
+    return routing_cut and len(reservations) > int(np.count_nonzero(~available))
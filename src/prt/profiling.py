@@ -0,0 +1,261 @@
+import time
+import json
+import csv
+import numpy as np
+
+# domains of the traci/libsumo API, all other attributes of a connection are top level functions like simulationStep
+DOMAINS = ["busstop", "calibrator", "chargingstation", "edge", "gui", "inductionloop", "junction", "lane", "lanearea",
+           "meandata", "multientryexit", "overheadwire", "parkingarea", "person", "poi", "polygon", "rerouter", "route",
+           "routeprobe", "simulation", "trafficlight", "variablespeedsign", "vehicle", "vehicletype"]
+
+
+class ConnectionProxy:
+    """
+    a class that wraps a connection to the simulation and passes every API call through the method call, which
+    subclasses override to observe (or replace) the calls. Controllers use the proxy like the connection itself.
+    Attributes:
+        conn: the wrapped connection : traci Connection or libsumo
+    Methods:
+        call
+    """
+    def __init__(self, conn):
+        """
+        initializer of the class
+        :param conn: the wrapped connection : traci Connection or libsumo
+        """
+        self.conn = conn
+        self._domains = {}
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set on the proxy itself
+        if name.startswith("_") or name == "conn":
+            raise AttributeError(name)
+        if name in DOMAINS:
+            if name not in self._domains:
+                self._domains[name] = _DomainProxy(self, name, getattr(self.conn, name))
+            return self._domains[name]
+        attribute = getattr(self.conn, name)
+        if callable(attribute) and not isinstance(attribute, type):
+            return lambda *args, **kwargs: self.call(None, name, attribute, args, kwargs)
+        return attribute
+
+    def call(self, domain, method, function, args, kwargs):
+        """
+        executes one API call
+        :param domain: name of the domain, None for top level functions : String
+        :param method: name of the method : String
+        :param function: the method of the wrapped connection : function
+        :param args: positional arguments : tuple
+        :param kwargs: keyword arguments : dictionary
+        :return: the result of the call
+        """
+        return function(*args, **kwargs)
+
+
+class _DomainProxy:
+    """
+    one domain (vehicle, edge, ...) of a wrapped connection, whose methods are passed through ConnectionProxy.call
+    """
+    def __init__(self, proxy, name, domain):
+        self._proxy = proxy
+        self._name = name
+        self._domain = domain
+
+    def __getattr__(self, method):
+        attribute = getattr(self._domain, method)
+        if not callable(attribute):
+            return attribute
+        proxy = self._proxy
+        domain = self._name
+
+        def call(*args, **kwargs):
+            return proxy.call(domain, method, attribute, args, kwargs)
+        # the wrapper is cached, so the lookup happens once per method
+        setattr(self, method, call)
+        return call
+
+
+class CountingConnection(ConnectionProxy):
+    """
+    a connection proxy that counts the API calls by domain and method for the section of the profiler that is running
+    Attributes:
+        profiler: the profiler the calls are counted for : Profiler
+    """
+    def __init__(self, conn, profiler):
+        """
+        initializer of the class
+        :param conn: the wrapped connection : traci Connection or libsumo
+        :param profiler: the profiler the calls are counted for : Profiler
+        """
+        super().__init__(conn)
+        self.profiler = profiler
+
+    def call(self, domain, method, function, args, kwargs):
+        self.profiler.count_call(method if domain is None else domain + "." + method)
+        return function(*args, **kwargs)
+
+
+class Profiler:
+    """
+    a class that records the wall time of the subsystems (sections) of each simulation step and counts the API calls
+    each of them makes. It writes a summary with percentiles and the most expensive steps and calls, and optionally a
+    per-step csv and a Chrome trace (chrome://tracing, Perfetto).
+    Attributes:
+        step: current simulation step : int
+        current: section that is running, None outside of sections : String
+        durations: wall time of each section in each step it ran, in seconds : dictionary of lists
+        steps: the steps belonging to the durations : dictionary of lists
+        calls: number of API calls of each section by domain.method : dictionary of dictionaries
+        step_calls: number of API calls of each section in the current step : dictionary
+        rows: per-step rows (step, section, wall time, calls), only kept if keep_steps is set : list
+        events: Chrome trace events, only kept if keep_trace is set : list
+        keep_steps: whether the per-step rows are kept : bool
+        keep_trace: whether the trace events are kept : bool
+        origin: wall time the trace starts at : float
+    Methods:
+        wrap
+        begin_step
+        section
+        count_call
+        summary
+        write_csv
+        write_trace
+    """
+    def __init__(self, keep_steps=False, keep_trace=False):
+        """
+        initializer of the class, constructs the attributes
+        :param keep_steps: keep the per-step rows for write_csv : bool
+        :param keep_trace: keep the trace events for write_trace : bool
+        """
+        self.step = 0
+        self.current = None
+        self.durations = {}
+        self.steps = {}
+        self.calls = {}
+        self.step_calls = {}
+        self.keep_steps = keep_steps
+        self.keep_trace = keep_trace
+        self.rows = []
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def wrap(self, conn):
+        """
+        :param conn: connection to the simulation : traci Connection or libsumo
+        :return: the connection with its calls counted by this profiler : CountingConnection
+        """
+        return CountingConnection(conn, self)
+
+    def begin_step(self, step):
+        """
+        starts recording a new simulation step
+        :param step: the simulation step : int
+        :return:
+        """
+        self.step = step
+        return
+
+    def section(self, name):
+        """
+        :param name: name of the subsystem : String
+        :return: context manager timing the subsystem in the current step : _Section
+        """
+        return _Section(self, name)
+
+    def count_call(self, call):
+        """
+        counts an API call for the running section
+        :param call: domain.method of the call : String
+        :return:
+        """
+        section = self.current or "other"
+        calls = self.calls.setdefault(section, {})
+        calls[call] = calls.get(call, 0) + 1
+        self.step_calls[section] = self.step_calls.get(section, 0) + 1
+        return
+
+    def _record(self, name, start, end):
+        """
+        records a finished section
+        :param name: name of the section : String
+        :param start: wall time the section started at : float
+        :param end: wall time the section ended at : float
+        :return:
+        """
+        self.durations.setdefault(name, []).append(end - start)
+        self.steps.setdefault(name, []).append(self.step)
+        calls = self.step_calls.pop(name, 0)
+        if self.keep_steps:
+            self.rows.append((self.step, name, end - start, calls))
+        if self.keep_trace:
+            self.events.append({"name": name, "ph": "X", "pid": 0, "tid": 0, "ts": (start - self.origin) * 1e6,
+                                "dur": (end - start) * 1e6, "args": {"step": self.step, "calls": calls}})
+        return
+
+    def summary(self, top=5):
+        """
+        :param top: number of the most expensive steps and calls listed per section : int
+        :return: summary of the recorded wall times and calls : String
+        """
+        total = sum(sum(d) for d in self.durations.values())
+        lines = ["%-16s %9s %6s %9s %9s %9s %9s %9s" % ("section", "total s", "share", "mean ms", "p50 ms", "p95 ms",
+                                                       "p99 ms", "max ms")]
+        for name, durations in sorted(self.durations.items(), key=lambda item: -sum(item[1])):
+            d = np.array(durations) * 1000.
+            p50, p95, p99 = np.percentile(d, [50, 95, 99])
+            lines.append("%-16s %9.3f %5.1f%% %9.3f %9.3f %9.3f %9.3f %9.3f" %
+                         (name, d.sum() / 1000., 100. * d.sum() / 1000. / total if total else 0., d.mean(), p50, p95,
+                          p99, d.max()))
+        for name, durations in sorted(self.durations.items()):
+            slowest = np.argsort(durations)[::-1][:top]
+            lines.append("%s: slowest steps: %s" % (name, ", ".join("%s (%.3f ms)" % (self.steps[name][i],
+                                                                                       durations[i] * 1000.)
+                                                                     for i in slowest)))
+        for name, calls in sorted(self.calls.items()):
+            offenders = sorted(calls.items(), key=lambda item: -item[1])[:top]
+            lines.append("%s: %s API calls, top: %s" % (name, sum(calls.values()),
+                                                        ", ".join("%s %s" % offender for offender in offenders)))
+        return "\n".join(lines)
+
+    def write_csv(self, path):
+        """
+        writes the per-step rows
+        :param path: path to the csv : String
+        :return:
+        """
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['step', 'section', 'wall_time', 'calls'])
+            writer.writerows(self.rows)
+        return
+
+    def write_trace(self, path):
+        """
+        writes the trace events in the Chrome trace format
+        :param path: path to the json : String
+        :return:
+        """
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        return
+
+
+class _Section:
+    """
+    context manager timing one section of a profiler
+    """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.outer = self.profiler.current
+        self.profiler.current = self.name
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        self.profiler.current = self.outer
+        self.profiler._record(self.name, self.start, end)
+        return False
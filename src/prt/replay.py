@@ -0,0 +1,226 @@
+import pickle
+import struct
+import time
+import zlib
+from prt.profiling import ConnectionProxy, DOMAINS
+
+MAGIC = b"PRTREC1\n"
+FRAME = struct.Struct("<I")  # length of each compressed chunk
+
+# methods that change the simulation instead of reading from it. When replaying with strict=False, the controllers may
+# issue other commands than the recorded ones (e.g. other speeds after changing their parameters)
+COMMAND_PREFIXES = ("set", "add", "append", "change", "dispatch", "remove", "subscribe", "unsubscribe", "move",
+                    "slowDown", "reroute", "highlight", "resume", "replace")
+
+
+class ReplayMismatch(Exception):
+    """
+    raised when the controllers make another call than the recorded one
+    """
+    pass
+
+
+def is_command(method):
+    """
+    :param method: name of the API method : String
+    :return: True if the method changes the simulation : bool
+    """
+    return method.startswith(COMMAND_PREFIXES)
+
+
+class RecordingConnection(ConnectionProxy):
+    """
+    a connection proxy that writes every API call together with its result (or exception) to a binary log. The calls
+    are collected in chunks, which are pickled, compressed with zlib and written with their length in front, so the log
+    is small and can be read chunk by chunk. The results have to be picklable, which holds for the traci backend. The
+    readings of the wall clock that limit the time budget of the dispatch are recorded as well, see clock.
+    Attributes:
+        log: the open log file : file
+        chunk: pickled records not written yet : list
+        chunk_size: number of records per chunk : int
+    Methods:
+        call
+        clock
+        flush
+        close
+    """
+    def __init__(self, conn, path, chunk_size=10000):
+        """
+        initializer of the class, creates the log
+        :param conn: the recorded connection : traci Connection or libsumo
+        :param path: path to the log : String
+        :param chunk_size: number of records per chunk : int
+        """
+        super().__init__(conn)
+        self.log = open(path, 'wb')
+        self.log.write(MAGIC)
+        self.chunk = []
+        self.chunk_size = chunk_size
+
+    def call(self, domain, method, function, args, kwargs):
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self.chunk.append(pickle.dumps((domain, method, args, kwargs, False, e), protocol=pickle.HIGHEST_PROTOCOL))
+            raise
+        # pickled right away, traci reuses some of the returned objects (e.g. the subscription results) in later steps
+        self.chunk.append(pickle.dumps((domain, method, args, kwargs, True, result), protocol=pickle.HIGHEST_PROTOCOL))
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+        return result
+
+    def clock(self):
+        """
+        reads the wall clock for a time budget and records the reading, so that a replay cuts the budgeted strategies
+        off at the same point as the recorded run instead of at its own wall time
+        :return: time.perf_counter() : float
+        """
+        return self.call(None, "clock", time.perf_counter, (), {})
+
+    def flush(self):
+        """
+        writes the collected records as one chunk
+        :return:
+        """
+        if self.chunk:
+            data = zlib.compress(pickle.dumps(self.chunk, protocol=pickle.HIGHEST_PROTOCOL))
+            self.log.write(FRAME.pack(len(data)))
+            self.log.write(data)
+            self.chunk = []
+        return
+
+    def close(self):
+        """
+        closes the log and the recorded connection
+        :return:
+        """
+        self.flush()
+        self.log.close()
+        self.conn.close()
+        return
+
+
+def read_log(path):
+    """
+    reads a log chunk by chunk
+    :param path: path to the log written by RecordingConnection : String
+    :return: generator of the records (domain, method, args, kwargs, ok, result) : generator
+    """
+    with open(path, 'rb') as log:
+        if log.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a recorded PRT log" % path)
+        while True:
+            header = log.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            for record in pickle.loads(zlib.decompress(log.read(FRAME.unpack(header)[0]))):
+                yield pickle.loads(record)
+
+
+class ReplayConnection:
+    """
+    a class that serves the controllers from a recorded log instead of a simulation. Every call is checked against the
+    next record and answered with its result, recorded exceptions are raised again. With strict=False, commands that
+    differ from the recorded ones are skipped, so controllers with changed parameters can be replayed as long as what
+    they read stays the same. The time budget of the dispatch runs on the recorded readings of the wall clock, so it
+    ends at the same point as in the recorded run, also when replaying on a faster or slower machine.
+    Attributes:
+        records: the records of the log : generator
+        strict: whether commands have to match the recorded ones : bool
+        calls: number of replayed calls : int
+    Methods:
+        call
+        clock
+        close
+    """
+    def __init__(self, path, strict=True):
+        """
+        initializer of the class
+        :param path: path to the log written by RecordingConnection : String
+        :param strict: if False, differing commands are skipped instead of raising ReplayMismatch : bool
+        """
+        self.records = read_log(path)
+        self.strict = strict
+        self.calls = 0
+        self._pending = None
+        self._domains = {}
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set on the connection itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in DOMAINS:
+            if name not in self._domains:
+                self._domains[name] = _ReplayDomain(self, name)
+            return self._domains[name]
+        return lambda *args, **kwargs: self.call(None, name, args, kwargs)
+
+    def _next(self):
+        """
+        :return: the next record, None at the end of the log : tuple
+        """
+        if self._pending is not None:
+            record, self._pending = self._pending, None
+            return record
+        return next(self.records, None)
+
+    def call(self, domain, method, args, kwargs):
+        """
+        replays one API call
+        :param domain: name of the domain, None for top level functions : String
+        :param method: name of the method : String
+        :param args: positional arguments : tuple
+        :param kwargs: keyword arguments : dictionary
+        :return: the recorded result of the call
+        """
+        while True:
+            record = self._next()
+            if record is None:
+                if not self.strict and is_command(method):
+                    return None
+                raise ReplayMismatch("the log ended before the call %s.%s%s" % (domain, method, args))
+            if record[:4] == (domain, method, args, kwargs):
+                break
+            if not self.strict and is_command(record[1]):
+                continue  # a recorded command that the controllers do not issue any more
+            if not self.strict and is_command(method):
+                self._pending = record  # a command that was not recorded
+                return None
+            raise ReplayMismatch("call %s %s.%s%s does not match the recorded %s.%s%s" %
+                                 (self.calls, domain, method, args, record[0], record[1], record[2]))
+        self.calls += 1
+        if not record[4]:
+            raise record[5]
+        return record[5]
+
+    def clock(self):
+        """
+        :return: the recorded reading of the wall clock, see RecordingConnection.clock : float
+        """
+        return self.call(None, "clock", (), {})
+
+    def close(self):
+        """
+        closes the log
+        :return:
+        """
+        self.records.close()
+        return
+
+
+class _ReplayDomain:
+    """
+    one domain (vehicle, edge, ...) of a replay connection
+    """
+    def __init__(self, replay, name):
+        self._replay = replay
+        self._name = name
+
+    def __getattr__(self, method):
+        replay = self._replay
+        domain = self._name
+
+        def call(*args, **kwargs):
+            return replay.call(domain, method, args, kwargs)
+        setattr(self, method, call)
+        return call
@@ -0,0 +1,309 @@
+import os
+import time
+import contextlib
+import xml.etree.ElementTree as ET
+from prt import checkpoint, connection, demand_cache, kpi, profiling, replay
+from prt import utils, merging_control, operating_strategies, subscriptions, network, fleet
+
+
+def route_files_from_config(config):
+    """
+    reads the route files of a sumo config, so that further route files can be appended on the command line
+    :param config: path to the sumo config : String
+    :return: paths of the route files : List
+    """
+    route_files = []
+    for option in ET.parse(config).getroot().iter('route-files'):
+        for route_file in option.get('value').split(','):
+            route_files.append(os.path.join(os.path.dirname(config), route_file.strip()))
+    return route_files
+
+
+class Session:
+    """
+    a class that owns one simulation run: the connection to sumo (a labelled traci connection or libsumo) and all
+    controllers working on it, i.e. the compressors, the demand and the fleet strategies. The connection is injected
+    into each of them, so several sessions on traci can run in one process and the same controllers run on libsumo.
+    Attributes:
+        options: options as returned by prt_runner.get_options
+        conn: connection to the simulation, None until started : traci Connection or libsumo
+        trips: the trips of the run : TripSchedule
+        forecast: forecast of the pickups at the stations, None unless rebalancing anticipatory : DemandForecast
+        step: current simulation step : int
+        step_multiplier: multiplier to calculate back to seconds from the simulation step length : float
+        subscriptions: subscriptions shared by all compressors : SubscriptionManager
+        network: cache of the static network geometry : NetworkCache
+        compressors: the compressors of the network : list
+        corridor: scheduler of the compressors along the vehicle routes, None for local merge control :
+        CorridorScheduler
+        distances: precomputed distances of the PRT network, None if no strategy needs them : DistanceTable
+        fleet: state of all taxis : FleetTracker
+        start_time: wall time the session was started at : float
+        clock: wall clock of the time budget of the dispatch, recorded and replayed with the traci calls : function
+        profiler: profiler of the step loop, None if not profiling : Profiler
+        kpis: collector of the KPIs, None if not collecting : KPICollector
+        dispatch_due: whether the dispatch has to run, because the fleet changed or reservations were left : bool
+        rebalance_due: whether the rebalancing has to run, because the fleet changed : bool
+        resume_state: state of the checkpoint the session resumes from, None for a new run : dictionary
+    Methods:
+        sumo_command
+        start
+        setup
+        section
+        simulation_step
+        run
+        summary
+        write_profile
+        close
+    """
+    def __init__(self, options):
+        """
+        initializer of the class, constructs the attributes and the demand of the run
+        :param options: options as returned by prt_runner.get_options
+        """
+        self.options = options
+        self.conn = None
+        self.forecast = None
+        if options.demand_cache:
+            # generated once per ODM and seed, later runs load the cached trips memory-mapped
+            scenario = demand_cache.generate(os.path.join('cfg', 'odm.csv'), options.seed, options.demand_cache)
+            self.trips = demand_cache.load_trips(scenario)
+            if options.rebalance == "anticipatory":
+                self.forecast = demand_cache.load_forecast(scenario)
+        else:
+            self.trips = utils.TripSchedule.from_dataframe(utils.trips_from_ODM('odm.csv', 'cfg', seed=options.seed))
+            if options.rebalance == "anticipatory":
+                self.forecast = utils.DemandForecast.from_ODM('odm.csv', 'cfg')
+        self.step = 0
+        self.step_multiplier = 1 / options.time_step
+        self.subscriptions = None
+        self.network = None
+        self.compressors = []
+        self.corridor = None
+        self.distances = None
+        self.fleet = None
+        self.start_time = None
+        self.clock = time.perf_counter
+        self.profiler = None
+        self.kpis = None
+        self.dispatch_due = True
+        self.rebalance_due = True
+        self.resume_state = checkpoint.load(options.resume) if options.resume else None
+        if options.profile or options.profile_csv or options.profile_trace:
+            self.profiler = profiling.Profiler(keep_steps=bool(options.profile_csv),
+                                               keep_trace=bool(options.profile_trace))
+
+    def sumo_command(self):
+        """
+        builds the sumo command line of the run. libsumo cannot run the gui, so it always uses the commandline version
+        :return: the command line : list
+        """
+        from sumolib import checkBinary
+        options = self.options
+        if options.nogui or options.backend == "libsumo":
+            sumoBinary = checkBinary('sumo')
+        else:
+            sumoBinary = checkBinary('sumo-gui')
+        # as dispatch algo, we can also use the ones from SUMO, e.g. greedy.
+        # the other --dispatch strategies are done via traci
+        dispatch_algorithm = "greedyClosest" if options.dispatch == "greedyClosest" else "traci"
+        sumo_cmd = [sumoBinary, "-c", options.config, "--ignore-route-errors", "--collision.action=remove",
+                    "--no-warnings", "--device.taxi.idle-algorithm=randomCircling",
+                    "--device.taxi.dispatch-algorithm=" + dispatch_algorithm, "--seed", str(options.seed)]
+        if options.output_prefix:
+            sumo_cmd += ["--output-prefix", options.output_prefix]
+        if options.checkpoint_dir:
+            # the saved states include the random number generators of sumo (idle circling, dispatch, speed deviation)
+            sumo_cmd += ["--save-state.rng"]
+        if self.resume_state is not None:
+            # sumo continues from the saved state, the controllers are restored in setup
+            sumo_cmd += ["--load-state", self.resume_state['sumo_state'], "--begin", str(self.resume_state['time'])]
+        if options.demand == "routes":
+            # sumo reads the persons from the route files itself (and each file only when its departures come up)
+            demand_files = utils.write_person_routes(self.trips, (options.output_prefix or "") + options.demand_file,
+                                                     options.demand_chunk or None)
+            sumo_cmd += ["--route-files", ",".join(route_files_from_config(options.config) + demand_files)]
+        return sumo_cmd
+
+    def start(self):
+        """
+        starts sumo on the backend of the options and connects to it, or opens the recorded log to replay
+        :return:
+        """
+        options = self.options
+        self.start_time = time.perf_counter()
+        if options.replay:
+            # no sumo at all, the controllers are served from the log
+            self.conn = replay.ReplayConnection(options.replay, strict=not options.replay_loose)
+            self.clock = self.conn.clock
+        else:
+            self.conn = connection.start(self.sumo_command(), options.backend, options.label, options.port)
+            if options.record:
+                self.conn = replay.RecordingConnection(self.conn, options.record)
+                self.clock = self.conn.clock
+        if self.profiler is not None:
+            # the controllers get the counting proxy, so their calls are attributed to their sections
+            self.conn = self.profiler.wrap(self.conn)
+        return
+
+    def setup(self):
+        """
+        creates the controllers on the connection: the compressors with their shared subscriptions and network cache,
+        the distance table of the PRT guideway and the fleet state. When resuming, their state is restored from the
+        checkpoint
+        :return:
+        """
+        conn = self.conn
+        vmax = conn.vehicletype.getMaxSpeed("dromos")
+        max_accel = conn.vehicletype.getAccel("dromos")
+        veh_len = conn.vehicletype.getLength("dromos")
+        time_gap = conn.vehicletype.getTau("dromos")
+        # all compressors share one set of subscriptions and one cache of the static network geometry
+        corridor = self.options.merge_control == "corridor"
+        self.subscriptions = subscriptions.SubscriptionManager(
+            conn, subscriptions.ROUTE_VARS if corridor else subscriptions.VEHICLE_VARS)
+        self.network = network.NetworkCache(conn)
+        smart_zipper_ids = [sz_id for sz_id in conn.trafficlight.getIDList() if "sz" in sz_id]
+        # the served vehicles of all compressors are kept in one store
+        store = merging_control.VehicleStore()
+        self.compressors = [merging_control.Compressor(zipper_id, self.options.stop_line, self.options.v2i_range, vmax,
+                                                       max_accel, time_gap, veh_len, self.subscriptions, self.network,
+                                                       conn, store)
+                            for zipper_id in smart_zipper_ids]
+        if corridor and self.compressors:
+            self.corridor = merging_control.CorridorScheduler(self.compressors, self.options.corridor_horizon)
+        # shortest distances on the PRT guideway, loaded from the disk cache after the first run. Only the strategies
+        # via traci and the KPIs read them, sumo's own dispatch and idling do not
+        if self.options.rebalance != "random_idling" or self.options.dispatch != "greedyClosest" or self.options.kpi:
+            self.distances = network.DistanceTable.from_net_file(self.options.prt_net)
+        # state of all taxis, read by dispatch and rebalancing
+        self.fleet = fleet.FleetTracker(conn, self.network)
+        if self.options.kpi:
+            self.kpis = kpi.KPICollector(conn, self.fleet, operating_strategies.prt_stops(self.distances, self.network),
+                                         self.options.kpi, self.options.kpi_bin, self.options.kpi_flush,
+                                         self.options.kpi_sample, self.options.dispatch != "greedyClosest")
+            for compressor in self.compressors:
+                compressor.kpi = self.kpis
+        if self.resume_state is not None:
+            checkpoint.restore(self, self.resume_state)
+        return
+
+    def section(self, name):
+        """
+        :param name: name of a subsystem of the step loop : String
+        :return: context manager that times the subsystem if profiling, otherwise does nothing
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.section(name)
+
+    def simulation_step(self):
+        """
+        advances the simulation by one step and runs all controllers on it
+        :return:
+        """
+        options = self.options
+        step = self.step
+        if self.profiler is not None:
+            self.profiler.begin_step(step)
+        with self.section("simulationStep"):
+            self.conn.simulationStep()
+        with self.section("subscriptions"):
+            self.subscriptions.update()
+
+        # the new vehicles of all compressors are served in one vectorized batch. Compressors without vehicles on
+        # their edges sleep, so the effort follows the traffic instead of the number of junctions
+        with self.section("compressors"):
+            compressors = self.compressors if options.wake_all else self.subscriptions.awake_compressors()
+            if self.corridor is not None:
+                self.corridor.execution_step(step, self.step_multiplier, compressors)
+            else:
+                merging_control.execution_step(compressors, step, self.step_multiplier)
+
+        if step % self.step_multiplier == 0:
+            # check if trips are occurring in the current step
+            if options.demand == "traci":
+                with self.section("spawn_persons"):
+                    utils.spawn_persons(step, self.trips, self.conn)
+            if options.rebalance != "random_idling" or options.dispatch != "greedyClosest" or self.kpis is not None:
+                with self.section("fleet"):
+                    self.fleet.update()
+                if self.fleet.changed:
+                    self.dispatch_due = self.rebalance_due = True
+            # dispatch, only if taxis changed their state, reservations are new or were left by the last dispatch
+            if options.dispatch != "greedyClosest" and step % (options.dispatch_period * self.step_multiplier) == 0:
+                with self.section("dispatch"):
+                    if options.wake_all or self.dispatch_due or self.conn.person.getTaxiReservations(1):
+                        self.dispatch_due = operating_strategies.dispatch(options.dispatch, self.distances,
+                                                                          options.dispatch_budget, self.fleet,
+                                                                          self.clock)
+            # rebalance, only if taxis changed their state (the anticipatory rebalancing also follows the forecast)
+            if step % (options.rebalance_period * self.step_multiplier) == 0 and \
+                    (options.wake_all or self.rebalance_due or options.rebalance == "anticipatory"):
+                self.rebalance_due = False
+                with self.section("rebalance"):
+                    operating_strategies.rebalance(options.rebalance, distances=self.distances, fleet=self.fleet,
+                                                   forecast=self.forecast, sim_time=step / self.step_multiplier,
+                                                   horizon=options.forecast_horizon)
+            if self.kpis is not None:
+                with self.section("kpi"):
+                    self.kpis.update(step / self.step_multiplier)
+
+        self.step += 1
+        if options.checkpoint_dir and self.step % (options.checkpoint_period * self.step_multiplier) == 0:
+            with self.section("checkpoint"):
+                checkpoint.save(self, options.checkpoint_dir)
+        return
+
+    def run(self):
+        """
+        starts the session, runs it for the duration of the options and closes it
+        :return: summary of the run : dictionary
+        """
+        self.start()
+        try:
+            self.setup()
+            while self.step < self.options.duration:
+                self.simulation_step()
+            if self.kpis is not None:
+                self.kpis.close(self.step / self.step_multiplier)
+        finally:
+            self.close()
+        if self.profiler is not None:
+            self.write_profile()
+        return self.summary()
+
+    def summary(self):
+        """
+        :return: summary of the run with the keys wall_time, steps and trips : dictionary
+        """
+        if self.options.demand == "traci":
+            trips = len(self.trips) - self.trips.remaining()
+        else:
+            trips = len(self.trips)
+        summary = {'wall_time': time.perf_counter() - self.start_time, 'steps': self.step, 'trips': trips}
+        if self.kpis is not None:
+            summary.update(self.kpis.summary())
+        return summary
+
+    def write_profile(self):
+        """
+        prints the profiling summary and writes the per-step csv and the trace if requested
+        :return:
+        """
+        print(self.profiler.summary())
+        if self.options.profile_csv:
+            self.profiler.write_csv(self.options.profile_csv)
+        if self.options.profile_trace:
+            self.profiler.write_trace(self.options.profile_trace)
+        return
+
+    def close(self):
+        """
+        closes the connection to sumo
+        :return:
+        """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        return
@@ -0,0 +1,160 @@
+import traci
+import traci.constants as tc
+from prt.connection import TRACI_ERRORS
+
+VEHICLE_VARS = [tc.VAR_SPEED, tc.VAR_LANEPOSITION, tc.VAR_ROAD_ID]
+# additionally needed by the corridor scheduler, which follows the vehicles along their routes
+ROUTE_VARS = VEHICLE_VARS + [tc.VAR_ROUTE_INDEX, tc.VAR_EDGES]
+
+
+class SubscriptionManager:
+    """
+    a class that bundles the TraCI subscriptions of all compressors. The edges of the compressors are subscribed once,
+    the vehicles on the incoming edges are subscribed once when they show up. The results of a step arrive together with
+    the simulation step, so the compressors read them without further round trips.
+    Attributes:
+        conn: connection to the simulation : traci Connection or libsumo
+        edges: subscribed edges : set
+        vehicle_edges: edges whose vehicles are subscribed to the vehicle variables : set
+        vehicle_vars: variables the vehicles are subscribed to : list
+        subscribed_veh: IDs of the subscribed vehicles : set
+        edge_vehicles: IDs of the vehicles on each subscribed edge in the last step : dictionary
+        vehicle_data: subscribed variables of each subscribed vehicle in the last step : dictionary
+        compressors: the registered compressors : list
+        listeners: indices of the compressors at each subscribed edge : dictionary
+        occupied: edges with vehicles on them in the last step : list
+    Methods:
+        add_edges
+        register
+        update
+        awake_compressors
+        vehicles_on
+        speed
+        lane_position
+        road_id
+        route_index
+        route
+    """
+    def __init__(self, conn=traci, vehicle_vars=VEHICLE_VARS):
+        """
+        initializer of the class, constructs the attributes
+        :param conn: connection to the simulation : traci Connection or libsumo
+        :param vehicle_vars: variables the vehicles are subscribed to, ROUTE_VARS for the corridor scheduler : list
+        """
+        self.conn = conn
+        self.vehicle_vars = vehicle_vars
+        self.edges = set()
+        self.vehicle_edges = set()
+        self.subscribed_veh = set()
+        self.edge_vehicles = {}
+        self.vehicle_data = {}
+        self.compressors = []
+        self.listeners = {}
+        self.occupied = []
+
+    def add_edges(self, edges, with_vehicle_data=False):
+        """
+        subscribes the vehicle IDs of the given edges
+        :param edges: IDs of the edges : list
+        :param with_vehicle_data: if True, the vehicles on these edges are subscribed as well : bool
+        :return:
+        """
+        for edge in edges:
+            if edge not in self.edges:
+                self.conn.edge.subscribe(edge, [tc.LAST_STEP_VEHICLE_ID_LIST])
+                self.edges.add(edge)
+            if with_vehicle_data:
+                self.vehicle_edges.add(edge)
+        return
+
+    def register(self, compressor):
+        """
+        subscribes the incoming and outgoing edges of a compressor
+        :param compressor: the compressor : Compressor
+        :return:
+        """
+        self.add_edges(compressor.incomings, with_vehicle_data=True)
+        self.add_edges(compressor.outgoings)
+        for edge in dict.fromkeys(compressor.incomings + compressor.outgoings):
+            self.listeners.setdefault(edge, []).append(len(self.compressors))
+        self.compressors.append(compressor)
+        return
+
+    def update(self):
+        """
+        collects the subscription results of the current step. Vehicles that entered an incoming edge are subscribed,
+        vehicles that left all of them are unsubscribed. Has to be called once per step after the simulation step.
+        :return:
+        """
+        results = self.conn.edge.getAllSubscriptionResults()
+        self.edge_vehicles = {edge: results[edge][tc.LAST_STEP_VEHICLE_ID_LIST] for edge in results}
+        self.occupied = [edge for edge, vids in self.edge_vehicles.items() if vids]
+        on_edges = set()
+        for edge in self.vehicle_edges:
+            on_edges.update(self.edge_vehicles.get(edge, ()))
+        # sorted, as the order of a set of strings changes from process to process and a replay needs the same calls
+        for vid in sorted(on_edges - self.subscribed_veh):
+            # the subscription answers with the current values right away
+            self.conn.vehicle.subscribe(vid, self.vehicle_vars)
+        for vid in sorted(self.subscribed_veh - on_edges):
+            try:
+                self.conn.vehicle.unsubscribe(vid)
+            except TRACI_ERRORS:
+                pass  # the vehicle has left the simulation
+        self.subscribed_veh = on_edges
+        self.vehicle_data = self.conn.vehicle.getAllSubscriptionResults()
+        return
+
+    def awake_compressors(self):
+        """
+        finds the compressors that have something to do in the current step, i.e. with vehicles on their incoming edges
+        (approaching or to be served) or on their outgoing edges (leaving). The others can skip the step, their
+        vehicles and slots stay as they are.
+        :return: the compressors with vehicles on their edges, in the order of their registration : list
+        """
+        indices = set()
+        for edge in self.occupied:
+            indices.update(self.listeners.get(edge, ()))
+        return [self.compressors[i] for i in sorted(indices)]
+
+    def vehicles_on(self, edge):
+        """
+        :param edge: ID of a subscribed edge : String
+        :return: IDs of the vehicles on the edge in the last step : tuple
+        """
+        return self.edge_vehicles.get(edge, ())
+
+    def speed(self, vid):
+        """
+        :param vid: ID of a vehicle on an incoming edge : String
+        :return: speed of the vehicle in the last step : float
+        """
+        return self.vehicle_data[vid][tc.VAR_SPEED]
+
+    def lane_position(self, vid):
+        """
+        :param vid: ID of a vehicle on an incoming edge : String
+        :return: position of the vehicle on its lane in the last step : float
+        """
+        return self.vehicle_data[vid][tc.VAR_LANEPOSITION]
+
+    def road_id(self, vid):
+        """
+        :param vid: ID of a vehicle on an incoming edge : String
+        :return: ID of the edge the vehicle is on in the last step : String
+        """
+        return self.vehicle_data[vid][tc.VAR_ROAD_ID]
+
+    def route_index(self, vid):
+        """
+        :param vid: ID of a vehicle on an incoming edge, subscribed with ROUTE_VARS : String
+        :return: index of the current edge in the route of the vehicle in the last step : int
+        """
+        return self.vehicle_data[vid][tc.VAR_ROUTE_INDEX]
+
+    def route(self, vid):
+        """
+        :param vid: ID of a vehicle on an incoming edge, subscribed with ROUTE_VARS : String
+        :return: IDs of the edges of the route of the vehicle in the last step : tuple
+        """
+        return self.vehicle_data[vid][tc.VAR_EDGES]
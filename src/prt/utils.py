@@ -1,85 +1,123 @@
 import traci
 import random
 import os
-import math
-import pandas as pd
+import bisect
+import numpy as np
+from prt import network as prt_network
+from prt.connection import TRACI_ERRORS
 
 
-def reroute_finished_veh():
+def reroute_finished_veh(network=None, conn=traci):
     """
     reroutes vehicles that have finished their route. Note: this function will probably be redundant in the scope
     of the Bad Hersfeld project since we are using the taxi device.
+    :param network: cache of the static network geometry, the shared one if None : NetworkCache
+    :param conn: connection to the simulation : traci Connection or libsumo
     :return:
     """
-    vids = traci.vehicle.getIDList()
+    if network is None:
+        network = prt_network.shared()
+    vids = conn.vehicle.getIDList()
     vids = [v for v in vids if "prt" in v]
-    edges = traci.edge.getIDList()
-    edges = [e for e in edges if "gne" in e]
-    edges = [e for e in edges if ":" not in e]
+    edges = network.prt_edges()
     for vid in vids:
         # route_ID = "route_" + vid[4:]
         route_ID = 'default'  # TODO: correct this!
-        route = traci.route.getEdges(str(route_ID))
-        if traci.vehicle.getSpeed(vid) == 0.0:
+        route = conn.route.getEdges(str(route_ID))
+        if conn.vehicle.getSpeed(vid) == 0.0:
             stopped = 1
             while stopped:
                 try:
-                    traci.vehicle.changeTarget(vid, random.choice(edges))
+                    conn.vehicle.changeTarget(vid, random.choice(edges))
                     stopped = 0
-                except traci.exceptions.TraCIException:
+                except TRACI_ERRORS:
                     pass
-        if traci.vehicle.getRoadID(vid) == route[-1] and traci.vehicle.getLanePosition(vid) + 10 > traci.lane.getLength(
-                traci.vehicle.getRoadID(vid) + '_0'):
+        if conn.vehicle.getRoadID(vid) == route[-1] and conn.vehicle.getLanePosition(vid) + 10 > \
+                network.edge_length(conn.vehicle.getRoadID(vid)):
             changed_target = 0
             while not changed_target:
                 try:
-                    traci.vehicle.changeTarget(vid, random.choice(edges))
+                    conn.vehicle.changeTarget(vid, random.choice(edges))
                     changed_target = 1
-                except traci.exceptions.TraCIException:
+                except TRACI_ERRORS:
                     pass
     return
 
 
-def count_prt_veh():
+def count_prt_veh(conn=traci):
     """
     counts the number of PRT/Dromos vehicles current in the simulation
+    :param conn: connection to the simulation : traci Connection or libsumo
     :return: number of vehicles of type PRT : Integer
     """
-    veh_ids = traci.vehicle.getIDList()
+    veh_ids = conn.vehicle.getIDList()
     prt_ids = [id for id in veh_ids if "prt" in id]
     nr_prt = len(prt_ids)
     return nr_prt
 
 
-def trips_from_ODM(ODM_file, path_to_ODM=""):
+def trips_from_ODM(ODM_file, path_to_ODM="", seed=None):
     """
     creates a DataFrame with columns [departure, origin, destination] from an Origin Destination Matrix (ODM). The
-    ODM is written in .xlsx and contains the amount of trips in each direction. This number is dispersed over 3600s
-    via a Poisson Process and an hourly scaling factor [0,1].
-    :param ODM_file: name of the ODM file including ending .xlsx : String
+    ODM contains the amount of trips in each direction. This number is dispersed over 3600s via a Poisson Process and
+    an hourly scaling factor [0,1]. All inter-arrival times of all OD pairs and hours are drawn in one batch.
+    :param ODM_file: name of the ODM file including ending .csv : String
     :param path_to_ODM: path to the file if not in same dir as module utils : String
+    :param seed: seed of the random number generator, None draws a fresh one : Integer or numpy Generator
     :return: a pandas DataFrame with columns [departure, origin, destination] : DataFrame
     """
-    odm = df_from_csv(ODM_file, path_to_ODM)
-    scaling_factors = list(odm.iloc[0, 6:])
-    trips = pd.DataFrame(columns=['departure', 'origin', 'destination'])
-    origins = list(odm.index)
-    destinations = list(odm)[:4]
-    for hour in range(0, len(scaling_factors)):
-        for row in range(0, 4):
-            for col in range(0, 4):
-                if odm.iloc[row, col] != 0:
-                    new_trip_times = poisson_process(int(odm.iloc[row, col]*scaling_factors[hour]),\
-                                                     int(odm.iloc[row, col]*scaling_factors[hour]))
-                    new_trip_times = [x+3600*hour for x in new_trip_times]
-                    new_trips = pd.DataFrame(columns=['departure', 'origin', 'destination'])
-                    new_trips['departure'] = new_trip_times
-                    new_trips['origin'] = origins[row]
-                    new_trips['destination'] = destinations[col]
-                    trips = pd.concat([trips, new_trips], ignore_index=True)
+    import pandas as pd
+    origins, destinations, volumes, scaling_factors = odm_layout(df_from_csv(ODM_file, path_to_ODM))
+    departures, rows, cols = trips_from_layout(volumes, scaling_factors, seed)
+    trips = pd.DataFrame({'departure': departures,
+                          'origin': np.asarray(origins, dtype=object)[rows],
+                          'destination': np.asarray(destinations, dtype=object)[cols]})
     return trips
 
 
+def trip_counts(volumes, scaling_factors):
+    """
+    :param volumes: trip volumes of the ODM (origins x destinations) : numpy array
+    :param scaling_factors: hourly scaling factors of the ODM : numpy array
+    :return: number of trips per hour and OD pair, shape (hours, origins, destinations) : numpy array
+    """
+    return (volumes[np.newaxis, :, :] * scaling_factors[:, np.newaxis, np.newaxis]).astype(int)
+
+
+def trips_from_layout(volumes, scaling_factors, seed=None):
+    """
+    draws the trips of an ODM, see trips_from_ODM
+    :param volumes: trip volumes of the ODM (origins x destinations) : numpy array
+    :param scaling_factors: hourly scaling factors of the ODM : numpy array
+    :param seed: seed of the random number generator, None draws a fresh one : Integer or numpy Generator
+    :return: departure of each trip : numpy array, index of its origin : numpy array,
+    index of its destination : numpy array
+    """
+    rng = np.random.default_rng(seed)
+    counts = trip_counts(volumes, scaling_factors).ravel()
+    hours, rows, cols = np.unravel_index(np.flatnonzero(counts), (len(scaling_factors),) + volumes.shape)
+    counts = counts[counts > 0]
+    departures = poisson_process(counts, counts, rng) + 3600 * np.repeat(hours, counts)
+    return departures, np.repeat(rows, counts), np.repeat(cols, counts)
+
+
+def odm_layout(odm):
+    """
+    splits an ODM DataFrame into its parts. The ODM is square (one row and one column per zone), followed by empty
+    spacer columns and the hourly scaling factors in the first row.
+    :param odm: the ODM as read by df_from_csv : DataFrame
+    :return: origins : List, destinations : List, trip volumes (origins x destinations) : numpy array,
+    hourly scaling factors : numpy array
+    """
+    import pandas as pd
+    nr_zones = len(odm.index)
+    origins = [str(o).strip() for o in odm.index]
+    destinations = [str(d).strip() for d in list(odm)[:nr_zones]]
+    volumes = odm.iloc[:, :nr_zones].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy(dtype=float)
+    scaling_factors = pd.to_numeric(odm.iloc[0, nr_zones:], errors='coerce').dropna().to_numpy(dtype=float)
+    return origins, destinations, volumes, scaling_factors
+
+
 def df_from_csv(ODM_file='odm.csv', path_to_ODM=""):
     """
     converts an Excel sheet to a pandas DataFrame
@@ -87,6 +125,7 @@ def df_from_csv(ODM_file='odm.csv', path_to_ODM=""):
     :param path_to_ODM: path to the file if not in same dir as module utils : String
     :return: a pandas DataFrame containing the same information as the .xlsx : DataFrame
     """
+    import pandas as pd
     if path_to_ODM != '':
         open_file = os.path.join(path_to_ODM, ODM_file)
     else:
@@ -95,60 +134,269 @@ def df_from_csv(ODM_file='odm.csv', path_to_ODM=""):
     return df
 
 
-def poisson_process(lambda_var, num_events):  # TODO something seems to be slightly off here - check again!
+def poisson_process(lambda_var, num_events, rng=None):  # TODO something seems to be slightly off here - check again!
     """
     this function models the Poisson Process that enables us to distribute hourly trip numbers over an interval of
-    time. This interval is 3600s in our case. More information can be found in the source below.
+    time. This interval is 3600s in our case. More information can be found in the source below. Several processes
+    can be drawn at once by passing arrays, their event times are returned back to back.
     source: https://timeseriesreasoning.com/contents/poisson-process/
-    :param lambda_var: incidence rate : Integer
-    :param num_events: number of events per interval : Integer
-    :return: absolute times of each arrival : List
-    """
-    lambda_var = lambda_var
-    num_events = num_events
-    event_num = []
-    inter_event_times = []
-    event_times = []
-    event_time = 0
-
-    for i in range(num_events):
-        event_num.append(i)
-        # Get a random probability value from the uniform distribution's PDF
-        n_rand = random.random()
-        # Generate the inter-event time from the exponential distribution's CDF using the Inverse-CDF technique
-        inter_event_time = -math.log(1.0 - n_rand) / lambda_var
-        inter_event_times.append(inter_event_time)
-        # Add the inter-event time to the running sum to get the next absolute event time
-        event_time = (event_time + inter_event_time)
-        event_times.append(event_time)
-    event_times = [math.floor(time*3600) for time in event_times]
+    :param lambda_var: incidence rate(s) : Integer or numpy array
+    :param num_events: number(s) of events per interval : Integer or numpy array
+    :param rng: random number generator, None draws a fresh one : numpy Generator
+    :return: absolute times of each arrival in seconds : numpy array
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    lambda_var = np.atleast_1d(lambda_var)
+    num_events = np.atleast_1d(num_events).astype(int)
+    # Generate the inter-event times from the exponential distribution, one rate per event
+    inter_event_times = rng.exponential(size=num_events.sum()) / np.repeat(lambda_var, num_events)
+    # Add the inter-event times to a running sum per process to get the absolute event times
+    event_times = np.cumsum(inter_event_times)
+    starts = np.cumsum(num_events) - num_events
+    offsets = np.repeat(event_times[starts - 1] * (starts > 0), num_events) if len(event_times) else 0
+    event_times = np.floor((event_times - offsets) * 3600).astype(int)
     return event_times
 
 
-def spawn_persons(step, trips):
+class TripSchedule:
+    """
+    a schedule of all trips of a simulation run, sorted by departure time. A cursor marks the first trip that has not
+    been spawned yet, so each step only touches the trips that depart in it instead of scanning all trips.
+    Attributes:
+        departures: departure times of the trips in seconds, sorted ascending : list or sequence
+        origins: origin edges of the trips : list or sequence
+        destinations: destination edges of the trips : list or sequence
+        cursor: index of the next trip that has not been spawned yet : int
+    Methods:
+        from_dataframe
+        from_sorted
+        pop_due
+        seek
+        remaining
+        get_state
+        set_state
+    """
+    def __init__(self, departures, origins, destinations):
+        """
+        initializer of the class, sorts the trips by departure time (stable, so trips with equal departure keep their
+        order)
+        :param departures: departure times of the trips in seconds : iterable
+        :param origins: origin edges of the trips : iterable
+        :param destinations: destination edges of the trips : iterable
+        """
+        departures = [int(d) for d in departures]
+        origins = list(origins)
+        destinations = list(destinations)
+        order = sorted(range(len(departures)), key=departures.__getitem__)
+        self.departures = [departures[i] for i in order]
+        self.origins = [origins[i] for i in order]
+        self.destinations = [destinations[i] for i in order]
+        self.cursor = 0
+
+    @classmethod
+    def from_dataframe(cls, trips):
+        """
+        builds a schedule from the output of trips_from_ODM
+        :param trips: DataFrame with columns [departure, origin, destination] : DataFrame
+        :return: the trip schedule : TripSchedule
+        """
+        return cls(trips['departure'], trips['origin'], trips['destination'])
+
+    @classmethod
+    def from_sorted(cls, departures, origins, destinations):
+        """
+        builds a schedule from trips that are already sorted by departure time, without copying them. The trips may be
+        numpy arrays, also memory-mapped ones, which are then only read where the cursor passes.
+        :param departures: departure times of the trips in seconds, sorted ascending : sequence
+        :param origins: origin edges of the trips : sequence
+        :param destinations: destination edges of the trips : sequence
+        :return: the trip schedule : TripSchedule
+        """
+        schedule = cls([], [], [])
+        schedule.departures = departures
+        schedule.origins = origins
+        schedule.destinations = destinations
+        return schedule
+
+    def pop_due(self, step):
+        """
+        returns all trips that depart up to the given second and moves the cursor behind them
+        :param step: current simulation time in seconds : Integer
+        :return: (departure, origin, destination) of every due trip : List
+        """
+        end = bisect.bisect_right(self.departures, int(step), lo=self.cursor)
+        due = list(zip(self.departures[self.cursor:end], self.origins[self.cursor:end],
+                       self.destinations[self.cursor:end]))
+        self.cursor = end
+        return due
+
+    def seek(self, step):
+        """
+        moves the cursor to the first trip departing at or after the given second, e.g. when starting a run late
+        :param step: simulation time in seconds : Integer
+        :return:
+        """
+        self.cursor = bisect.bisect_left(self.departures, int(step))
+        return
+
+    def remaining(self):
+        """
+        :return: number of trips that have not been spawned yet : Integer
+        """
+        return len(self.departures) - self.cursor
+
+    def get_state(self):
+        """
+        :return: the trips and the cursor, e.g. for a checkpoint, so resuming does not depend on the ODM : dictionary
+        """
+        return {'departures': self.departures, 'origins': self.origins, 'destinations': self.destinations,
+                'cursor': self.cursor}
+
+    def set_state(self, state):
+        """
+        restores the trips and the cursor returned by get_state
+        :param state: the state : dictionary
+        :return:
+        """
+        self.departures = list(state['departures'])
+        self.origins = list(state['origins'])
+        self.destinations = list(state['destinations'])
+        self.cursor = state['cursor']
+        return
+
+    def __len__(self):
+        return len(self.departures)
+
+
+class DemandForecast:
+    """
+    a forecast of the pickups at each origin of an ODM. The trips of each hour (the volumes times the hourly scaling
+    factor, like in trips_from_ODM) are spread evenly over the hour, so the expected pickups of any time window follow
+    from the pickups accumulated up to the full hours, which are precomputed once.
+    Attributes:
+        origins: index of each origin of the ODM : dictionary
+        cumulative: expected pickups at each origin from the start of the day up to each full hour, shape
+        (hours + 1, origins) : numpy array
+    Methods:
+        from_ODM
+        expected
+    """
+    def __init__(self, origins, hourly_pickups):
+        """
+        initializer of the class, accumulates the pickups
+        :param origins: origins of the ODM : list
+        :param hourly_pickups: expected pickups at each origin in each hour, shape (hours, origins) : numpy array
+        """
+        self.origins = {origin: i for i, origin in enumerate(origins)}
+        hourly_pickups = np.asarray(hourly_pickups, dtype=float).reshape(-1, len(origins))
+        self.cumulative = np.vstack([np.zeros((1, len(origins))), np.cumsum(hourly_pickups, axis=0)])
+
+    @classmethod
+    def from_ODM(cls, ODM_file, path_to_ODM=""):
+        """
+        builds the forecast of an ODM
+        :param ODM_file: name of the ODM file including ending .csv : String
+        :param path_to_ODM: path to the file if not in same dir as module utils : String
+        :return: the forecast : DemandForecast
+        """
+        origins, destinations, volumes, scaling_factors = odm_layout(df_from_csv(ODM_file, path_to_ODM))
+        return cls(origins, trip_counts(volumes, scaling_factors).sum(axis=2))
+
+    def _accumulated(self, time):
+        """
+        :param time: time of the day in seconds : float
+        :return: expected pickups at each origin from the start of the day up to the time : numpy array
+        """
+        hour = min(max(time / 3600., 0.), len(self.cumulative) - 1.)
+        full_hour = min(int(hour), len(self.cumulative) - 2)
+        return self.cumulative[full_hour] + (hour - full_hour) * (self.cumulative[full_hour + 1] -
+                                                                  self.cumulative[full_hour])
+
+    def expected(self, time, horizon, stations):
+        """
+        :param time: begin of the time window in seconds : float
+        :param horizon: length of the time window in seconds : float
+        :param stations: IDs of the stations, stations that are no origin of the ODM expect no pickups : list
+        :return: expected pickups at each station within the time window : numpy array
+        """
+        pickups = self._accumulated(time + horizon) - self._accumulated(time)
+        return np.array([pickups[self.origins[station]] if station in self.origins else 0. for station in stations])
+
+
+def spawn_persons(step, trips, conn=traci):
     """
     checks if the current simulation step yields a trip. if so, it adds a person to traci and appends a driving
     stage with a taxi to it.
     :param step: current simulation step : Integer
-    :param trips: the list of all trips that were calculated for the simulation runtime : DataFrame
+    :param trips: the trips that were calculated for the simulation runtime. A TripSchedule only touches the trips
+    that are due, a DataFrame is scanned completely in every call : TripSchedule or DataFrame
+    :param conn: connection to the simulation : traci Connection or libsumo
     :return:
     """
-    if int(step) in list(trips['departure']):
+    if isinstance(trips, TripSchedule):
+        # trips that were due in skipped steps are spawned now instead of getting lost
+        due = [(origin, destination) for departure, origin, destination in trips.pop_due(step)]
+    elif int(step) in list(trips['departure']):
         departure_index = trips.loc[trips['departure'] == step].index.tolist()
-        # add person
-        p_at_t = 0
-        for index in departure_index:
-            pers_id = "prt_user_%s" % int(step) + ("_%s" % p_at_t if p_at_t > 0 else "")
-            try:
-                traci.person.add(personID=pers_id, edgeID=trips.loc[index, 'origin'], pos=-1)
-                traci.person.appendWalkingStage(personID=pers_id, edges=[trips.loc[index, 'origin']], arrivalPos=-1, stopID=trips.loc[index, 'origin']+'_stop')
-                traci.person.appendDrivingStage(personID=pers_id, toEdge=trips.loc[index, 'destination'] + "_arrival",
-                                                stopID=trips.loc[index, 'destination']+'_arrival_stop', lines='taxi')
-                p_at_t += 1
-            except traci.TraCIException as e:
-                print(e)
-                pass
+        due = [(trips.loc[index, 'origin'], trips.loc[index, 'destination']) for index in departure_index]
+    else:
+        return
+    # add person
+    p_at_t = 0
+    for origin, destination in due:
+        pers_id = "prt_user_%s" % int(step) + ("_%s" % p_at_t if p_at_t > 0 else "")
+        try:
+            conn.person.add(personID=pers_id, edgeID=origin, pos=-1)
+            conn.person.appendWalkingStage(personID=pers_id, edges=[origin], arrivalPos=-1, stopID=origin+'_stop')
+            conn.person.appendDrivingStage(personID=pers_id, toEdge=destination + "_arrival",
+                                            stopID=destination+'_arrival_stop', lines='taxi')
+            p_at_t += 1
+        except TRACI_ERRORS as e:
+            print(e)
+            pass
     return
 
 
-
+def write_person_routes(trips, route_file, chunk_length=None):
+    """
+    streams the trips into a SUMO route file so that SUMO reads the persons itself instead of them being added via
+    traci in every step. Each person walks to the stop of its origin and rides a taxi to its destination, like in
+    spawn_persons. Optionally, the trips are split into one file per time chunk.
+    :param trips: the trips that were calculated for the simulation runtime : TripSchedule or DataFrame
+    :param route_file: name of the route file, e.g. demand.rou.xml. Chunks are named demand.0.rou.xml etc. : String
+    :param chunk_length: length of the time chunks in seconds, None writes a single file : Integer
+    :return: names of the written route files : List
+    """
+    if not isinstance(trips, TripSchedule):
+        trips = TripSchedule.from_dataframe(trips)
+    base, ending = route_file, ''
+    if route_file.endswith('.rou.xml'):
+        base, ending = route_file[:-len('.rou.xml')], '.rou.xml'
+    route_files = []
+    outf = None
+    chunk = None
+    last_departure = None
+    p_at_t = 0
+    for departure, origin, destination in zip(trips.departures, trips.origins, trips.destinations):
+        if outf is None or (chunk_length and departure // chunk_length != chunk):
+            if outf is not None:
+                outf.write('</routes>\n')
+                outf.close()
+            chunk = departure // chunk_length if chunk_length else None
+            route_files.append(route_file if chunk is None else "%s.%s%s" % (base, chunk, ending))
+            outf = open(route_files[-1], 'w')
+            outf.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<routes>\n')
+        # same person IDs as in spawn_persons
+        p_at_t = p_at_t + 1 if departure == last_departure else 0
+        last_departure = departure
+        pers_id = "prt_user_%s" % departure + ("_%s" % p_at_t if p_at_t > 0 else "")
+        outf.write('    <person id="%s" depart="%.2f">\n' % (pers_id, departure))
+        outf.write('        <walk edges="%s" busStop="%s_stop"/>\n' % (origin, origin))
+        outf.write('        <ride from="%s" to="%s_arrival" busStop="%s_arrival_stop" lines="taxi"/>\n' %
+                   (origin, destination, destination))
+        outf.write('    </person>\n')
+    if outf is not None:
+        outf.write('</routes>\n')
+        outf.close()
+    return route_files
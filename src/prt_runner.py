@@ -5,12 +5,10 @@ import os
 sys.path += [os.path.join(os.environ["SUMO_HOME"], "tools")]
 
 import sumolib  # noqa
-from sumolib import checkBinary  # noqa
-import traci  # noqa
-from prt import utils, merging_control, operating_strategies  # noqa
+from prt import session  # noqa
 
 
-def get_options():
+def get_options(args=None):
     argParser = sumolib.options.ArgumentParser()
     argParser.add_argument("--nogui", action="store_true",
                            default=False, help="run the commandline version of sumo")
@@ -20,65 +18,88 @@ def get_options():
                            help="stop line distance in meters")
     argParser.add_argument("--v2i-range", type=float, default=200.,
                            help="communication distance in meters")
+    argParser.add_argument("--merge-control", choices=["local", "corridor"], default="local",
+                           help="reserve slots at each compressor on its own or along the routes of the vehicles")
+    argParser.add_argument("--corridor-horizon", type=int, default=3,
+                           help="number of compressors a vehicle gets slots at with --merge-control corridor, "
+                                "counting the one it approaches (3: the next compressor and the 2 behind it)")
     argParser.add_argument("--time-step", type=float, default=1.,
                            help="simulation step size")
     argParser.add_argument("--config", default="prt.sumocfg", help="sumo config to run")
-    return argParser.parse_args()
-
-
-def runner():
+    argParser.add_argument("--seed", type=int, default=42,
+                           help="random seed of the demand generation and of sumo")
+    argParser.add_argument("--backend", choices=["traci", "libsumo"], default="traci",
+                           help="run sumo via a traci socket (also with the gui) or inside this process via libsumo "
+                                "(without gui, one simulation per process)")
+    argParser.add_argument("--label", default="default", help="label of the traci connection")
+    argParser.add_argument("--port", type=int, help="port of the traci connection, a free one if not given")
+    argParser.add_argument("--output-prefix", help="prefix of all sumo output files")
+    argParser.add_argument("--prt-net", default="../prt_infra/prt.net.xml",
+                           help="net file of the PRT guideway, used for the precomputed distance table")
+    argParser.add_argument("--rebalance", default="random_idling",
+                           choices=["random_idling", "park_in_depot", "park_closest_no_idling", "park_closest_idling",
+                                    "park_optimal_no_idling", "park_optimal_idling", "anticipatory"],
+                           help="rebalancing method for idle vehicles, anticipatory also moves vehicles ahead of the "
+                                "demand forecast from the ODM")
+    argParser.add_argument("--rebalance-period", type=int, default=1,
+                           help="interval of the rebalancing in seconds")
+    argParser.add_argument("--forecast-horizon", type=float, default=900.,
+                           help="time window of the demand forecast of the anticipatory rebalancing in seconds")
+    argParser.add_argument("--dispatch", default="greedyClosest", choices=["greedyClosest", "mockup", "optimal"],
+                           help="dispatch algorithm, greedyClosest is done by sumo, the others via traci")
+    argParser.add_argument("--dispatch-period", type=int, default=10,
+                           help="interval of the traci dispatch in seconds")
+    argParser.add_argument("--dispatch-budget", type=float, default=0.05,
+                           help="maximum wall time of a traci dispatch call in seconds, exceeded by at most one "
+                                "route and one assignment batch")
+    argParser.add_argument("--wake-all", action="store_true", default=False,
+                           help="run all compressors and fleet strategies in every step, instead of only the "
+                                "compressors with vehicles on their edges and the strategies after changes")
+    argParser.add_argument("--demand", choices=["traci", "routes"], default="traci",
+                           help="add the ODM trips via traci in every step or write them to a route file for sumo")
+    argParser.add_argument("--demand-file", default="prt_demand.rou.xml",
+                           help="route file the ODM trips are written to when using --demand routes")
+    argParser.add_argument("--demand-chunk", type=int, default=0,
+                           help="split the demand route file into chunks of this many seconds (0: single file)")
+    argParser.add_argument("--demand-cache",
+                           help="directory of the cached demand scenarios, the trips of the ODM and seed are generated "
+                                "into it once and loaded from it in later runs")
+    argParser.add_argument("--kpi", help="collect KPIs during the run and write them in time bins to this csv "
+                                         "(or to Parquet files if it ends with .parquet)")
+    argParser.add_argument("--kpi-bin", type=float, default=900., help="length of the KPI time bins in seconds")
+    argParser.add_argument("--kpi-flush", type=float, default=3600., help="interval of writing the KPIs in seconds")
+    argParser.add_argument("--kpi-sample", type=float, default=10.,
+                           help="interval of sampling the driven distances and station occupancies in seconds")
+    argParser.add_argument("--record", help="record all traci calls and their results to this log")
+    argParser.add_argument("--replay", help="run the controllers on a recorded log instead of sumo, the dispatch "
+                                            "budget ends at the recorded readings of the wall clock")
+    argParser.add_argument("--replay-loose", action="store_true", default=False,
+                           help="when replaying, skip commands that differ from the recorded ones instead of failing")
+    argParser.add_argument("--checkpoint-dir",
+                           help="save checkpoints of the sumo and controller state to this directory")
+    argParser.add_argument("--checkpoint-period", type=int, default=3600,
+                           help="interval of the checkpoints in seconds")
+    argParser.add_argument("--resume", help="resume from this checkpoint (checkpoint_<time>.pkl), also with other "
+                                            "options to fork the run. KPI files keep the rows written before the "
+                                            "checkpoint")
+    argParser.add_argument("--profile", action="store_true", default=False,
+                           help="time the subsystems of each step, count their traci calls and print a summary")
+    argParser.add_argument("--profile-csv", help="write the profiled wall time and calls of each step to this csv")
+    argParser.add_argument("--profile-trace", help="write the profiled steps as Chrome trace (json) to this file")
+    return argParser.parse_args(args)
+
+
+def runner(options=None):
     """
     this function starts traci and runs the preconfigured traffic in Bad Hersfeld as well as the PRT/Dromos
-    application. It initializes the compressors and calls methos from the modules utils and operating_strategies.
-    :return:
+    application. The compressors and the methods from the modules utils and operating_strategies run in a session,
+    which owns the connection to sumo.
+    :param options: options as returned by get_options, parsed from the command line if None
+    :return: summary of the run with the keys wall_time, steps and trips : dictionary
     """
-    options = get_options()
-    # this script has been called from the command line. It will start sumo as a
-    # server, then connect and run
-    if options.nogui:
-        sumoBinary = checkBinary('sumo')
-    else:
-        sumoBinary = checkBinary('sumo-gui')
-    traci.start([sumoBinary, "-c", options.config, "--ignore-route-errors", "--collision.action=remove",
-                 "--no-warnings", "--device.taxi.idle-algorithm=randomCircling",
-                 "--device.taxi.dispatch-algorithm=greedyClosest"])
-    # as dispatch algo, we can also use the ones from SUMO, e.g. greedy.
-    # When using 'traci', you must un-comment line 64
-    vmax = traci.vehicletype.getMaxSpeed("dromos")
-    max_accel = traci.vehicletype.getAccel("dromos")
-    veh_len = traci.vehicletype.getLength("dromos")
-    time_gap = traci.vehicletype.getTau("dromos")
-    step_multiplier = 1 / options.time_step
-
-    step = 0
-
-    trips = utils.trips_from_ODM('odm.csv', 'cfg')
-
-    TL_ids = traci.trafficlight.getIDList()
-    smart_zipper_ids = [sz_id for sz_id in TL_ids if "sz" in sz_id]
-    smart_zippers = []
-    for zipper_id in smart_zipper_ids:
-        smart_zippers.append(merging_control.Compressor(zipper_id, options.stop_line, options.v2i_range,
-                                                        vmax, max_accel, time_gap, veh_len))
-
-    while step < options.duration:
-        traci.simulationStep()
-
-        for zipper in smart_zippers:
-            zipper.execution_step(step, step_multiplier)
-
-        if step % step_multiplier == 0:
-            # check if trips are occurring in the current step
-            utils.spawn_persons(step, trips)
-            # dispatch
-            # operating_strategies.dispatch('mockup') # un-comment in case you want to use it
-            # rebalance
-            operating_strategies.rebalance('random_idling')
-
-        step += 1
-
-    traci.close()
-    return
+    if options is None:
+        options = get_options()
+    return session.Session(options).run()
 
 
 if __name__ == "__main__":
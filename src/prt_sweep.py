@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import sys
+import os
+import csv
+import itertools
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path += [os.path.join(os.environ["SUMO_HOME"], "tools")]
+
+import sumolib  # noqa
+import prt_runner  # noqa
+from prt import demand_cache  # noqa
+
+RESULT_FIELDS = ['cell', 'seed', 'status', 'wall_time', 'steps', 'trips', 'error']
+
+
+def get_options(args=None):
+    argParser = sumolib.options.ArgumentParser(
+        description="runs prt_runner for each combination of a parameter grid and a list of seeds in parallel. "
+                    "Further arguments after -- are passed to every run.")
+    argParser.add_argument("--grid", action="append", default=[],
+                           help="parameter of prt_runner and its values, e.g. --grid v2i-range=100,200 "
+                                "(can be given several times)")
+    argParser.add_argument("--seeds", default="42", help="comma separated list of seeds")
+    argParser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                           help="number of parallel sumo instances")
+    argParser.add_argument("--results", default="sweep_results.csv",
+                           help="csv file the results are collected in, finished cells in it are skipped")
+    argParser.add_argument("--output-dir", default="sweep_outputs", help="directory of the sumo outputs of each cell")
+    argParser.add_argument("--demand-cache",
+                           help="directory of the cached demand scenarios, the trips of all seeds are generated "
+                                "into it before the runs start")
+    argParser.add_argument("runner_args", nargs="*", help="arguments passed to every prt_runner run")
+    return argParser.parse_args(args)
+
+
+def parse_grid(grid):
+    """
+    parses the grid arguments
+    :param grid: arguments of the form name=value1,value2 : list
+    :return: names of the parameters : list, all combinations of their values : list of tuples
+    """
+    names = []
+    values = []
+    for parameter in grid:
+        name, value_list = parameter.split("=", 1)
+        names.append(name.lstrip("-"))
+        values.append(value_list.split(","))
+    return names, list(itertools.product(*values))
+
+
+def cell_id(names, values, seed):
+    """
+    :return: unique, readable ID of a cell of the sweep, also used as its traci label : String
+    """
+    return "_".join(["%s=%s" % (name, value) for name, value in zip(names, values)] + ["seed=%s" % seed])
+
+
+def finished_cells(results):
+    """
+    reads the cells that have already been run successfully
+    :param results: path to the results csv : String
+    :return: IDs of the finished cells : set
+    """
+    if not os.path.isfile(results):
+        return set()
+    with open(results, newline='') as f:
+        return {row['cell'] for row in csv.DictReader(f) if row['status'] == 'ok'}
+
+
+def run_cell(cell, runner_args):
+    """
+    runs one cell of the sweep in its own process with its own traci label and port
+    :param cell: ID of the cell : String
+    :param runner_args: command line arguments of prt_runner : list
+    :return: result row of the cell : dictionary
+    """
+    port = sumolib.miscutils.getFreeSocketPort()
+    options = prt_runner.get_options(runner_args + ["--nogui", "--label", cell, "--port", str(port)])
+    row = {'cell': cell, 'seed': options.seed}
+    try:
+        row.update(prt_runner.runner(options))
+        row['status'] = 'ok'
+    except Exception:
+        row['status'] = 'failed'
+        row['error'] = traceback.format_exc(limit=3).replace("\n", " | ")
+    return row
+
+
+def sweep(options):
+    """
+    runs all cells of the sweep that are not finished yet and appends their results to the results csv
+    :param options: options as returned by get_options
+    :return:
+    """
+    names, combinations = parse_grid(options.grid)
+    done = finished_cells(options.results)
+    os.makedirs(options.output_dir, exist_ok=True)
+    shared_args = list(options.runner_args)
+    if options.demand_cache:
+        # generated once here instead of in every worker
+        for seed in options.seeds.split(","):
+            demand_cache.generate(os.path.join("cfg", "odm.csv"), int(seed), options.demand_cache)
+        shared_args += ["--demand-cache", options.demand_cache]
+    cells = []
+    for values in combinations:
+        for seed in options.seeds.split(","):
+            cell = cell_id(names, values, seed)
+            if cell in done:
+                continue
+            runner_args = shared_args + ["--seed", seed,
+                                         "--output-prefix", os.path.join(options.output_dir, cell + "_")]
+            for name, value in zip(names, values):
+                runner_args += ["--" + name, value]
+            cells.append((cell, dict(zip(names, values)), runner_args))
+    print("%s cells to run, %s already finished" % (len(cells), len(done)))
+    fields = RESULT_FIELDS[:1] + names + RESULT_FIELDS[1:]
+    write_header = not os.path.isfile(options.results)
+    with open(options.results, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        if write_header:
+            writer.writeheader()
+        # each sumo instance runs in a fresh process with its own traci module
+        with ProcessPoolExecutor(max_workers=options.workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(run_cell, cell, runner_args): parameters
+                       for cell, parameters, runner_args in cells}
+            for future in as_completed(futures):
+                row = future.result()
+                row.update(futures[future])
+                writer.writerow(row)
+                f.flush()  # finished cells survive an interrupted sweep
+                print("%s: %s" % (row['cell'], row['status']))
+    return
+
+
+if __name__ == "__main__":
+    sweep(get_options())